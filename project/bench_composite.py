@@ -0,0 +1,68 @@
+# bench_composite.py
+# Canvas.render 레이어 합성 성능 비교 (기존 float64 방식 vs 정수 in-place 방식)
+#   python bench_composite.py [--sizes 512 4096] [--layers 1 8 32] [--seconds 2]
+
+import argparse
+import time
+import numpy as np
+
+from engine.canvas import Canvas
+
+def legacy_render(canvas):
+    # 변경 전 구현: 매 프레임 새 배열 + float64 임시 배열
+    result = np.zeros((canvas.height, canvas.width, 4), dtype=np.uint8)
+    for layer in canvas.layers:
+        if layer.visible:
+            alpha = layer.pixels[:, :, 3:] / 255.0
+            result = (1 - alpha) * result + alpha * layer.pixels
+    return result.astype(np.uint8)
+
+def make_canvas(size, n_layers):
+    canvas = Canvas(size, size, storage="dense")
+    rng = np.random.default_rng(0)
+    # 메모리를 아끼기 위해 모든 레이어가 같은 픽셀 배열을 공유한다
+    pixels = rng.integers(0, 256, (size, size, 4), dtype=np.uint8)
+    for _ in range(n_layers):
+        canvas.add_layer()
+        canvas.layers[-1].pixels = pixels
+    return canvas
+
+def full_render(canvas):
+    # 모든 레이어가 바뀐 것으로 표시해서 캐시 없이 전체를 다시 합성
+    for layer in canvas.layers:
+        layer.touch()
+    return canvas.render()
+
+def active_render(canvas):
+    # 그리는 중의 경우: 활성 레이어만 바뀌고 아래 스택은 캐시를 쓴다
+    canvas.get_active_layer().touch()
+    return canvas.render()
+
+def measure(fn, canvas, seconds):
+    fn(canvas)
+    frames, start = 0, time.perf_counter()
+    while True:
+        fn(canvas)
+        frames += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return frames / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 4096])
+    parser.add_argument("--layers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'layers':>6} {'legacy fps':>12} {'in-place fps':>13} {'speedup':>8} {'active fps':>11}")
+    for size in args.sizes:
+        for n_layers in args.layers:
+            canvas = make_canvas(size, n_layers)
+            old = measure(legacy_render, canvas, args.seconds)
+            new = measure(full_render, canvas, args.seconds)
+            active = measure(active_render, canvas, args.seconds)
+            print(f"{size:>6} {n_layers:>6} {old:>12.2f} {new:>13.2f} {new / old:>7.1f}x {active:>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench_spatial.py
+# 공간 인덱스 생성/원 질의 성능 비교 (QuadtreeNode, SpatialHash 삽입 vs PackedRTree bulk load)
+#   python bench_spatial.py [--sizes 10000 100000 1000000] [--queries 1000] [--radius 15] [--cell-size 32]
+
+import argparse
+import time
+import numpy as np
+
+from engine.quadtree import QuadtreeNode
+from engine.spatial_hash import SpatialHash
+from engine.rtree import PackedRTree
+
+def make_segments(n, side, rng):
+    # 짧은 선분들이 이어지는 random walk stroke (stroke 하나당 선분 64개)
+    per_stroke = 64
+    n_strokes = -(-n // per_stroke)
+    starts = rng.uniform(0, side, (n_strokes, 1, 2))
+    steps = rng.normal(0, 4, (n_strokes, per_stroke + 1, 2))
+    points = np.clip(starts + np.cumsum(steps, axis=1), 0, side - 1)
+    segments = np.concatenate((points[:, :-1], points[:, 1:]), axis=2).reshape(-1, 4)[:n]
+    ids = np.repeat(np.arange(n_strokes), per_stroke)[:n]
+    idx = np.tile(np.arange(per_stroke), n_strokes)[:n]
+    half_widths = rng.integers(1, 10, n_strokes).repeat(per_stroke)[:n] / 2
+    return ids, idx, segments, half_widths
+
+def build_dynamic(tree, ids, idx, segments, half_widths):
+    for item in zip(ids.tolist(), idx.tolist(), *segments.T.tolist(), half_widths.tolist()):
+        tree.insert(*item)
+    return tree
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def run_queries(tree, circles):
+    hits = 0
+    for cx, cy, r in circles:
+        hits += len(tree.query_circle(cx, cy, r))
+    return hits
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--radius", type=float, default=15.0)
+    parser.add_argument("--cell-size", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{'segments':>9} {'qt build s':>11} {'hash build s':>13} {'rt build s':>11} "
+          f"{'qt query us':>12} {'hash query us':>14} {'rt query us':>12}")
+    for n in args.sizes:
+        rng = np.random.default_rng(0)
+        # 선분 밀도가 일정하도록 캔버스 크기를 맞춘다
+        side = int(np.sqrt(n) * 8)
+        ids, idx, segments, half_widths = make_segments(n, side, rng)
+        circles = np.column_stack((rng.uniform(0, side, (args.queries, 2)),
+                                   np.full(args.queries, args.radius))).tolist()
+
+        quadtree, qt_build = timed(build_dynamic, QuadtreeNode(0, 0, side, side), ids, idx, segments, half_widths)
+        grid, hash_build = timed(build_dynamic, SpatialHash(side, side, args.cell_size), ids, idx, segments, half_widths)
+        rtree, rt_build = timed(PackedRTree, ids, idx, segments, half_widths, side, side)
+        qt_hits, qt_query = timed(run_queries, quadtree, circles)
+        hash_hits, hash_query = timed(run_queries, grid, circles)
+        rt_hits, rt_query = timed(run_queries, rtree, circles)
+        assert qt_hits == hash_hits == rt_hits
+        us = 1e6 / args.queries
+        print(f"{n:>9} {qt_build:>11.2f} {hash_build:>13.2f} {rt_build:>11.2f} "
+              f"{qt_query * us:>12.1f} {hash_query * us:>14.1f} {rt_query * us:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# engine/brush.py
+
+import numpy as np
+from functools import lru_cache
+
+# 한 번에 계산할 (dab 수 x 마스크 픽셀 수)의 상한, 임시 배열 크기를 제한한다
+MAX_BATCH_PIXELS = 1 << 20
+
+@lru_cache(maxsize=128)
+def circle_offsets(radius):
+    """
+    반지름 radius 원 안에 들어가는 픽셀의 (dy, dx) 오프셋 배열 (반지름별 캐시)
+    """
+    r = int(radius)
+    yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+    mask = xx**2 + yy**2 <= radius**2
+    dy = yy[mask].astype(np.intp)
+    dx = xx[mask].astype(np.intp)
+    dy.setflags(write=False)
+    dx.setflags(write=False)
+    return dy, dx
+
+def circle_pixels(centers, radius, width, height):
+    """
+    반지름 radius 원형 dab들이 덮는 캔버스 안 픽셀 (ys, xs), 중복 없이 행 우선 순서
+    - centers는 이미 정수로 반올림된 좌표여야 한다
+    """
+    centers = np.asarray(centers, dtype=np.intp).reshape(-1, 2)
+    dy, dx = circle_offsets(radius)
+    keys = []
+    chunk = max(1, MAX_BATCH_PIXELS // len(dy))
+    for start in range(0, len(centers), chunk):
+        part = centers[start:start + chunk]
+        xs = (part[:, 0:1] + dx).ravel()
+        ys = (part[:, 1:2] + dy).ravel()
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        keys.append(np.unique(ys[inside] * width + xs[inside]))
+    key = np.unique(np.concatenate(keys)) if len(keys) > 1 else keys[0]
+    return key // width, key % width
+
+def dab_bounds(centers, radius, width, height):
+    """
+    dab들이 덮는 영역 (x0, y0, x1, y1)을 캔버스 범위로 잘라서 반환, 겹치지 않으면 None
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    if len(centers) == 0:
+        return None
+    r = int(np.ceil(radius))
+    x0 = max(0, int(np.floor(centers[:, 0].min())) - r)
+    y0 = max(0, int(np.floor(centers[:, 1].min())) - r)
+    x1 = min(width, int(np.ceil(centers[:, 0].max())) + r + 1)
+    y1 = min(height, int(np.ceil(centers[:, 1].max())) + r + 1)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+def stamp_circles(pixels, centers, radius, color):
+    """
+    여러 개의 원형 dab을 한 번에 찍기 (브러시 영역의 bounding box만 계산)
+    - pixels: (H, W, 4) 배열
+    - centers: (N, 2) 형태의 (x, y) 중심 좌표들
+    - radius: 반지름
+    - color: (R, G, B, A)
+    반환값: 변경된 영역 (x0, y0, x1, y1), 아무것도 그리지 않았으면 None
+    """
+    centers = np.rint(np.asarray(centers, dtype=np.float64).reshape(-1, 2)).astype(np.intp)
+    if len(centers) == 0:
+        return None
+    height, width = pixels.shape[:2]
+    r = int(radius)
+
+    # 캔버스와 전혀 겹치지 않는 dab은 미리 제외
+    cx, cy = centers[:, 0], centers[:, 1]
+    visible = (cx + r >= 0) & (cx - r < width) & (cy + r >= 0) & (cy - r < height)
+    centers = centers[visible]
+    if len(centers) == 0:
+        return None
+
+    dy, dx = circle_offsets(radius)
+    color = np.asarray(color, dtype=np.uint8)
+    chunk = max(1, MAX_BATCH_PIXELS // len(dy))
+    for start in range(0, len(centers), chunk):
+        part = centers[start:start + chunk]
+        xs = (part[:, 0:1] + dx).ravel()
+        ys = (part[:, 1:2] + dy).ravel()
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        pixels[ys[inside], xs[inside]] = color
+
+    return dab_bounds(centers, r, width, height)
+
+@lru_cache(maxsize=64)
+def dab_kernel(radius, hardness=1.0):
+    """
+    안티앨리어싱된 원형 dab의 커버리지 커널 (float32, 0~1), (반지름, 경도)별 캐시
+    - hardness 1.0: 가장자리 1px만 부드럽게 처리된 단단한 원
+    - hardness 0.0: 중심에서 가장자리까지 smoothstep으로 감쇠
+    """
+    r = int(np.ceil(radius + 0.5))
+    yy, xx = np.ogrid[-r:r + 1, -r:r + 1]
+    dist = np.sqrt(xx**2 + yy**2).astype(np.float32)
+    outer = radius + 0.5
+    inner = min(radius * hardness, radius - 0.5)
+    t = np.clip((outer - dist) / max(outer - inner, 1e-6), 0.0, 1.0)
+    kernel = (t * t * (3 - 2 * t)).astype(np.float32)
+    kernel.setflags(write=False)
+    return kernel
+
+@lru_cache(maxsize=64)
+def kernel_offsets(radius, hardness=1.0):
+    """
+    dab_kernel에서 커버리지가 0보다 큰 칸의 (dy, dx, 커버리지) 배열 (반지름, 경도별 캐시)
+    """
+    kernel = dab_kernel(radius, hardness)
+    r = kernel.shape[0] // 2
+    dy, dx = np.nonzero(kernel > 0)
+    weights = kernel[dy, dx]
+    dy, dx = (dy - r).astype(np.intp), (dx - r).astype(np.intp)
+    for a in (dy, dx, weights):
+        a.setflags(write=False)
+    return dy, dx, weights
+
+def quantize_hardness(hardness):
+    # 캐시 적중률을 위해 경도를 0.05 단위로 맞춘다
+    return round(min(1.0, max(0.0, hardness)) * 20) / 20
+
+def _unique_sum(keys, values):
+    # 같은 key의 values를 더해서 (정렬된 고유 key, 합) 반환
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse.ravel(), weights=values, minlength=len(keys))
+
+def soft_coverage(centers, radius, width, height, hardness=1.0, flow=1.0):
+    """
+    dab들이 덮는 픽셀과 누적 커버리지 (ys, xs, cov)
+    - dab 순서와 관계없이 cov = 1 - prod(1 - k * flow) 이므로 log(1 - k * flow)를 픽셀별로 더한다
+    - 영역 전체가 아니라 dab이 실제로 덮는 픽셀만 다루고, 한 번에 펼치는 크기는 MAX_BATCH_PIXELS로 제한한다
+    - centers는 이미 정수로 반올림된 좌표여야 한다
+    """
+    centers = np.asarray(centers, dtype=np.intp).reshape(-1, 2)
+    dy, dx, weights = kernel_offsets(radius, quantize_hardness(hardness))
+    # k * flow 가 1이면 log가 -inf가 되므로 살짝 줄인다 (uint8로 바꾸면 차이가 없다)
+    logs = np.log1p(-np.minimum(weights.astype(np.float64) * flow, 1.0 - 1e-7))
+
+    keys, sums = [], []
+    chunk = max(1, MAX_BATCH_PIXELS // len(dy))
+    for start in range(0, len(centers), chunk):
+        part = centers[start:start + chunk]
+        xs = (part[:, 0:1] + dx).ravel()
+        ys = (part[:, 1:2] + dy).ravel()
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        key, total = _unique_sum(ys[inside] * width + xs[inside], np.broadcast_to(logs, (len(part), len(dy))).ravel()[inside])
+        keys.append(key)
+        sums.append(total)
+    if len(keys) > 1:
+        key, total = _unique_sum(np.concatenate(keys), np.concatenate(sums))
+    else:
+        key, total = keys[0], sums[0]
+    cov = (-np.expm1(total)).astype(np.float32)
+    return key // width, key % width, cov
+
+def blend_pixels(pixels, ys, xs, alpha, color):
+    """
+    pixels[ys, xs]에 color를 픽셀별 알파 alpha (0~1)로 straight alpha over 합성
+    - out_a = sa + da(1 - sa), out_c = (c sa + dc da (1 - sa)) / out_a
+    """
+    rgba = pixels[ys, xs].astype(np.float32)
+    rgba /= 255.0
+    alpha = alpha[:, None]
+    dst_a = rgba[:, 3:4] * (1.0 - alpha)        # da(1 - sa)
+    out_a = dst_a + alpha
+    rgb = rgba[:, :3] * dst_a + alpha * (np.asarray(color[:3], dtype=np.float32) / 255.0)
+    rgb /= np.maximum(out_a, 1e-6)
+    rgba[:, :3] = rgb
+    rgba[:, 3:4] = out_a
+    rgba *= 255.0
+    rgba += 0.5
+    pixels[ys, xs] = rgba.astype(np.uint8)
+
+def stamp_soft(pixels, centers, radius, color, hardness=1.0, opacity=1.0, flow=1.0):
+    """
+    부드러운 dab들을 레이어 위에 알파 합성으로 찍기
+    - flow: dab 하나가 쌓는 농도, 겹칠수록 누적된다
+    - opacity: 한 번의 호출(배치) 안에서 누적 농도가 넘지 못하는 상한
+    - color의 알파 값도 함께 반영된다
+    - dab이 덮는 픽셀만 모아서 계산하므로 배치의 bounding box 크기와 관계없다
+    반환값: 변경된 영역 (x0, y0, x1, y1), 아무것도 그리지 않았으면 None
+    """
+    centers = np.rint(np.asarray(centers, dtype=np.float64).reshape(-1, 2)).astype(np.intp)
+    if len(centers) == 0 or opacity <= 0 or flow <= 0:
+        return None
+    height, width = pixels.shape[:2]
+    r = dab_kernel(radius, quantize_hardness(hardness)).shape[0] // 2
+    bounds = dab_bounds(centers, r, width, height)
+    if bounds is None:
+        return None
+
+    ys, xs, cov = soft_coverage(centers, radius, width, height, hardness, flow)
+    if not len(cov):
+        return None
+    # 소스 알파 = min(cov, 1) * opacity * color_a
+    alpha = np.minimum(cov, 1.0) * np.float32(opacity * (color[3] / 255.0))
+    blend_pixels(pixels, ys, xs, alpha, color)
+    return bounds
@@ -1,17 +1,50 @@
 # engine/canvas.py
 
 import numpy as np
-from .layer import Layer
+from .layer import Layer, TiledLayer, TILE_SIZE
+from .brush import circle_pixels, soft_coverage, blend_pixels
+from .tools import TileRecorder
 
 class Canvas:
-    def __init__(self, width, height):
+    """
+    - storage: 레이어 픽셀 저장 방식
+        "tiled"  : 처음 그리는 타일만 할당하는 TiledLayer (기본값)
+        "dense"  : 레이어마다 (height, width, 4) 배열 하나
+        "memmap" : TiledLayer의 타일을 임시 파일 위의 np.memmap에 둔다 (메모리보다 큰 캔버스)
+    """
+    def __init__(self, width, height, storage="tiled"):
         self.width = width
         self.height = height
+        self.storage = storage
         self.layers = []
         self.active_layer_index = None
 
+        # 합성용 작업 버퍼는 (타일 단위로) 필요한 만큼만 키워서 재사용한다
+        self._acc = np.zeros(0, dtype=np.uint16)
+        self._tmp = np.zeros(0, dtype=np.uint16)
+        self._alpha = np.zeros(0, dtype=np.uint16)
+
+        # 전체 프레임과 활성 레이어 아래/위 레이어들의 합성 결과 캐시 (premultiplied RGBA)
+        # render()를 처음 부를 때 할당한다, 큰 캔버스는 render_region으로 필요한 영역만 합성할 것
+        self._frame = None
+        self._below = None
+        self._above = None
+        self._below_key = None
+        self._above_key = None
+        self._above_empty = True
+        self._frame_key = None
+
+        self._recorder = None
+
+    def _new_layer(self):
+        if self.storage == "dense":
+            return Layer(self.width, self.height)
+        if self.storage in ("tiled", "memmap"):
+            return TiledLayer(self.width, self.height, scratch=self.storage == "memmap")
+        raise ValueError(f"알 수 없는 레이어 저장 방식: {self.storage}")
+
     def add_layer(self, name=None):
-        layer = Layer(self.width, self.height)
+        layer = self._new_layer()
         layer.name = name or f"Layer {len(self.layers)}"
         self.layers.append(layer)
         self.active_layer_index = len(self.layers) - 1
@@ -24,6 +57,21 @@ class Canvas:
             else:
                 self.active_layer_index = min(index, len(self.layers) - 1)
 
+    def snapshot(self):
+        """
+        레이어들의 읽기 전용 사본으로 만든 Canvas (백그라운드 내보내기용, render_region만 쓴다)
+        - 합성 작업 버퍼도 따로 가지므로 다른 스레드에서 이 Canvas를 합성해도 원본과 충돌하지 않는다
+        """
+        snap = Canvas(self.width, self.height, self.storage)
+        snap.layers = [layer.snapshot() for layer in self.layers]
+        snap.active_layer_index = self.active_layer_index
+        return snap
+
+    def release(self):
+        # snapshot()으로 만든 Canvas를 다 쓴 뒤 호출, 원본 레이어가 공유하던 타일을 돌려받는다
+        for layer in self.layers:
+            layer.release()
+
     def select_layer(self, index):
         if 0 <= index < len(self.layers):
             self.active_layer_index = index
@@ -33,30 +81,209 @@ class Canvas:
             return None
         return self.layers[self.active_layer_index]
 
-    def draw_circle(self, x, y, radius, color):
+    def begin_edit(self):
+        """
+        되돌리기 단위 편집 시작: 이후 그리기로 바뀌는 타일의 원본만 기록한다
+        """
+        layer = self.get_active_layer()
+        self._recorder = TileRecorder(layer) if layer is not None else None
+
+    def end_edit(self):
+        """
+        편집 종료, 바뀐 타일만 담은 DrawCommand (변경이 없으면 None)를 반환
+        """
+        recorder, self._recorder = self._recorder, None
+        return recorder.finish() if recorder else None
+
+    def draw_circle(self, x, y, radius, color, hardness=1.0, opacity=1.0, flow=1.0, antialias=True):
         """
         현재 선택된 레이어에 원형 브러시로 그리기
         - x, y: 중심 좌표
         - radius: 반지름
         - color: (R, G, B, A)
+        - hardness, opacity, flow: 부드러운 브러시 설정 (engine.brush.stamp_soft 참고)
+        """
+        return self.draw_points([(x, y)], radius, color, hardness, opacity, flow, antialias)
+
+    def draw_points(self, points, radius, color, hardness=1.0, opacity=1.0, flow=1.0, antialias=True):
+        """
+        현재 선택된 레이어에 여러 dab을 한 번에 찍기 (예: Stroke.points 전체)
+        - antialias=False 이면 알파 합성 없이 단단한 원으로 덮어쓴다
+        - 변경된 영역 (x0, y0, x1, y1)을 반환
         """
         layer = self.get_active_layer()
         if layer is None:
             print("❌ No active layer selected.")
-            return
+            return None
+
+        # dab들이 실제로 덮는 픽셀만 구한다 (배치 전체의 bounding box는 만들지 않는다)
+        centers = np.rint(np.asarray(points, dtype=np.float64).reshape(-1, 2)).astype(np.intp)
+        if not len(centers):
+            return None
+        if antialias:
+            if opacity <= 0 or flow <= 0:
+                return None
+            ys, xs, cov = soft_coverage(centers, radius, self.width, self.height, hardness, flow)
+            alpha = np.minimum(cov, 1.0) * np.float32(opacity * (color[3] / 255.0))
+        else:
+            ys, xs = circle_pixels(centers, radius, self.width, self.height)
+            alpha = None
+        if not len(ys):
+            return None
+
+        # 되돌리기용으로는 덮인 픽셀이 있는 타일의 원본만 기록한다
+        if self._recorder is not None and self._recorder.layer is layer:
+            self._recorder.touch_pixels(ys, xs)
+
+        # 레이어 타일 단위 블록마다 덮인 부분만 읽어서 찍고 다시 쓴다 (비용이 칠한 면적을 따라간다)
+        color = np.asarray(color, dtype=np.uint8)
+        for (x0, y0, x1, y1), sel in self._blocks(ys, xs, getattr(layer, "tile_size", TILE_SIZE)):
+            region = layer.read(x0, y0, x1, y1)
+            ly, lx = ys[sel] - y0, xs[sel] - x0
+            if alpha is None:
+                region[ly, lx] = color
+            else:
+                blend_pixels(region, ly, lx, alpha[sel], color)
+            layer.write(x0, y0, region)
+        layer.touch()
+        return int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1
 
-        yy, xx = np.ogrid[:self.height, :self.width]
-        mask = (xx - x)**2 + (yy - y)**2 <= radius**2
-        layer.pixels[mask] = color
-        print(f"🖌️ Drew circle on layer '{layer.name}' at ({x}, {y})")
+    @staticmethod
+    def _blocks(ys, xs, size):
+        """
+        픽셀 (ys, xs)를 size 크기 블록별로 묶어 (블록 안에서 덮인 영역 (x0, y0, x1, y1), 픽셀 번호) 나열
+        """
+        key = (ys // size) * (int(xs.max()) // size + 1) + xs // size
+        order = np.argsort(key, kind="stable")
+        splits = np.flatnonzero(np.diff(key[order])) + 1
+        for sel in np.split(order, splits):
+            bx, by = xs[sel], ys[sel]
+            yield (int(bx.min()), int(by.min()), int(bx.max()) + 1, int(by.max()) + 1), sel
+
+    def revision(self):
+        return tuple((id(layer), layer.version, layer.visible) for layer in self.layers)
+
+    @staticmethod
+    def _stack_key(layers):
+        return tuple((id(layer), layer.version, layer.visible) for layer in layers)
+
+    def _blend_layer(self, out, layer, x0=0, y0=0):
+        """
+        layer의 (x0, y0)부터 out 크기만큼을 out 위에 타일 단위로 합성, 무언가 합성했으면 True
+        """
+        height, width = out.shape[:2]
+        blended = False
+        # 타일 레이어는 비어있지 않은 타일만 넘겨주므로, 빈 레이어/빈 영역은 합성 비용이 없다
+        for tx, ty, tile in layer.tiles((x0, y0, x0 + width, y0 + height)):
+            # 완전히 투명한 타일은 합성 결과에 영향이 없으므로 건너뛴다
+            if tile[:, :, 3].any():
+                h, w = tile.shape[:2]
+                self.alpha_blend(out[ty - y0:ty - y0 + h, tx - x0:tx - x0 + w], tile)
+                blended = True
+        return blended
+
+    def _composite(self, out, layers, x0=0, y0=0):
+        out.fill(0)
+        empty = True
+        for layer in layers:
+            if layer.visible and self._blend_layer(out, layer, x0, y0):
+                empty = False
+        return empty
+
+    def render_region(self, x0, y0, x1, y1, out=None):
+        """
+        (x0, y0, x1, y1) 영역만 보이는 레이어를 모두 합성 (uint8, premultiplied RGBA)
+        - 캐시 없이 그 영역에 걸친 타일만 읽으므로, 큰 캔버스도 띠 단위로 나눠 내보낼 수 있다
+        """
+        if out is None:
+            out = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+        self._composite(out, self.layers, x0, y0)
+        return out
 
     def render(self):
-        result = np.zeros((self.height, self.width, 4), dtype=np.uint8)
-        for layer in self.layers:
-            if layer.visible:
-                result = self.alpha_blend(result, layer.pixels)
+        """
+        보이는 레이어를 모두 합성한 프레임(uint8, premultiplied RGBA)을 반환
+        - 활성 레이어 아래/위 스택은 캐시해두고, 바뀐 레이어가 있을 때만 다시 합성
+        - 반환되는 배열은 내부 버퍼이므로 다음 render() 호출 시 덮어써진다
+        """
+        idx = self.active_layer_index
+        if idx is None:
+            below, active, above = self.layers, None, []
+        else:
+            below, active, above = self.layers[:idx], self.layers[idx], self.layers[idx + 1:]
+
+        if self._frame is None:
+            shape = (self.height, self.width, 4)
+            self._frame = np.zeros(shape, dtype=np.uint8)
+            self._below = np.zeros(shape, dtype=np.uint8)
+            self._above = np.zeros(shape, dtype=np.uint8)
+
+        below_key = self._stack_key(below)
+        if below_key != self._below_key:
+            self._composite(self._below, below)
+            self._below_key = below_key
+
+        above_key = self._stack_key(above)
+        if above_key != self._above_key:
+            self._above_empty = self._composite(self._above, above)
+            self._above_key = above_key
+
+        frame_key = (below_key, self._stack_key([active] if active else []), above_key)
+        if frame_key == self._frame_key:
+            return self._frame
+
+        result = self._frame
+        np.copyto(result, self._below)
+        if active is not None and active.visible:
+            self._blend_layer(result, active)
+        if not self._above_empty:
+            self.blend_premultiplied(result, self._above)
+        self._frame_key = frame_key
         return result
 
+    def _scratch(self, h, w):
+        n = h * w
+        if self._alpha.size < n:
+            self._acc = np.zeros(n * 4, dtype=np.uint16)
+            self._tmp = np.zeros(n * 4, dtype=np.uint16)
+            self._alpha = np.zeros(n, dtype=np.uint16)
+        return (self._acc[:n * 4].reshape(h, w, 4), self._tmp[:n * 4].reshape(h, w, 4),
+                self._alpha[:n].reshape(h, w, 1))
+
     def alpha_blend(self, base, overlay):
-        alpha = overlay[:, :, 3:] / 255.0
-        return (1 - alpha) * base + alpha * overlay
+        """
+        overlay(straight RGBA)를 base(premultiplied RGBA) 위에 정수 연산으로 덮어 합성 (in-place)
+        - out = (overlay * a + base * (255 - a)) / 255, 알파 채널은 overlay 값 대신 255 사용
+        """
+        acc, tmp, alpha = self._scratch(*base.shape[:2])
+        np.copyto(alpha, overlay[:, :, 3:])
+        np.multiply(overlay, alpha, out=acc)
+        np.multiply(alpha[:, :, 0], 255, out=acc[:, :, 3])
+        np.subtract(255, alpha, out=alpha)
+        np.multiply(base, alpha, out=tmp)
+        np.add(acc, tmp, out=acc)
+
+        # x / 255 반올림을 시프트로 계산: (x + 128 + ((x + 128) >> 8)) >> 8
+        np.add(acc, 128, out=acc)
+        np.right_shift(acc, 8, out=tmp)
+        np.add(acc, tmp, out=acc)
+        np.right_shift(acc, 8, out=acc)
+        np.copyto(base, acc, casting='unsafe')
+        return base
+
+    def blend_premultiplied(self, base, overlay):
+        """
+        premultiplied RGBA 끼리의 over 합성 (in-place)
+        - out = overlay + base * (255 - overlay_a) / 255
+        """
+        acc, tmp, alpha = self._scratch(*base.shape[:2])
+        np.subtract(255, overlay[:, :, 3:], out=alpha)
+        np.multiply(base, alpha, out=acc)
+        np.add(acc, 128, out=acc)
+        np.right_shift(acc, 8, out=tmp)
+        np.add(acc, tmp, out=acc)
+        np.right_shift(acc, 8, out=acc)
+        np.add(acc, overlay, out=acc)
+        np.minimum(acc, 255, out=acc)
+        np.copyto(base, acc, casting='unsafe')
+        return base
@@ -0,0 +1,205 @@
+# engine/document.py
+#
+# 캔버스 문서 파일 형식 (little endian, 각 구역은 64바이트 단위로 정렬)
+#   header    : HEADER
+#   layers    : LAYER_DTYPE x n_layers         (보이기 여부, 이름)
+#   strokes   : STROKE_DTYPE x n_strokes       (ID, 색, 반지름, 종류, 점 범위, bounding box)
+#   points    : float32 (n_points, 2)          (모든 stroke의 점을 그리기 순서대로 이어 붙임)
+#   pixels    : uint8 (height, width, 4) x n_layers      (0뿐인 행 띠는 쓰지 않고 파일 구멍으로 둔다)
+# 불러올 때는 파일을 memmap으로 열고 각 구역을 view로 잘라 쓰므로 점마다 파이썬 객체를 만들지 않는다
+
+import os
+import struct
+import numpy as np
+
+from engine.canvas import Canvas
+from engine.stroke import Stroke, CurveStroke, POINT_DTYPE
+from engine.vectorlayer import VectorLayer
+
+MAGIC = b"PCNV"
+VERSION = 1
+ALIGN = 64
+SAVE_BAND_ROWS = 256
+
+# magic, version, reserved, canvas w/h, vector layer w/h, n_layers, n_strokes, n_points
+HEADER = struct.Struct("<4sHHIIIIIIQ")
+
+LAYER_DTYPE = np.dtype([("visible", "u1"), ("name", "S63")])
+
+STROKE_KIND = {Stroke: 0, CurveStroke: 1}
+STROKE_TYPES = {kind: cls for cls, kind in STROKE_KIND.items()}
+
+STROKE_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("color", "u1", (4,)),
+    ("radius", "<i4"),
+    ("kind", "u1"),
+    ("reserved", "u1", (7,)),
+    ("start", "<u8"),
+    ("count", "<u8"),
+    ("bounds", "<f4", (4,)),
+])
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+def _layout(n_layers, n_strokes, n_points, height, width):
+    """
+    각 구역의 시작 위치 (layers, strokes, points, pixels 목록)
+    """
+    layers = _aligned(HEADER.size)
+    strokes = _aligned(layers + n_layers * LAYER_DTYPE.itemsize)
+    points = _aligned(strokes + n_strokes * STROKE_DTYPE.itemsize)
+    offset = _aligned(points + n_points * 2 * np.dtype(POINT_DTYPE).itemsize)
+    pixels = []
+    for _ in range(n_layers):
+        pixels.append(offset)
+        offset = _aligned(offset + height * width * 4)
+    return layers, strokes, points, pixels
+
+def _stored_points(stroke):
+    # CurveStroke는 평탄화된 점이 아니라 제어점을 저장한다
+    return stroke.control_points if isinstance(stroke, CurveStroke) else stroke.points
+
+def save_document(path, canvas, vector_layer):
+    """
+    canvas의 레이어와 vector_layer의 (살아있는) stroke를 path에 저장
+    - 임시 파일에 쓴 뒤 교체하므로, 같은 파일을 memmap으로 불러온 문서도 안전하게 덮어쓸 수 있다
+    - 쓰기에 실패하면 임시 파일을 지우고 OSError를 그대로 올린다
+    """
+    strokes = list(vector_layer.strokes.values())
+    arrays = [_stored_points(stroke) for stroke in strokes]
+    counts = np.array([len(points) for points in arrays], dtype=np.uint64)
+
+    table = np.zeros(len(strokes), dtype=STROKE_DTYPE)
+    table["id"] = [stroke.id for stroke in strokes]
+    table["color"] = np.array([tuple(stroke.color) + (255,) * (4 - len(stroke.color)) for stroke in strokes],
+                              dtype=np.uint8).reshape(-1, 4)
+    table["radius"] = [stroke.radius for stroke in strokes]
+    table["kind"] = [STROKE_KIND[type(stroke)] for stroke in strokes]
+    table["count"] = counts
+    table["start"] = np.cumsum(counts) - counts
+    table["bounds"] = np.array([stroke.bounds or (0, 0, 0, 0) for stroke in strokes]).reshape(-1, 4)
+
+    layers = np.zeros(len(canvas.layers), dtype=LAYER_DTYPE)
+    layers["visible"] = [layer.visible for layer in canvas.layers]
+    # 63바이트로 자를 때 여러 바이트 글자가 반으로 잘리지 않도록 글자 경계에서 자른다
+    layers["name"] = [layer.name.encode("utf-8")[:63].decode("utf-8", "ignore").encode("utf-8")
+                      for layer in canvas.layers]
+
+    n_points = int(counts.sum())
+    layer_off, stroke_off, point_off, pixel_offs = _layout(
+        len(layers), len(strokes), n_points, canvas.height, canvas.width)
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, canvas.width, canvas.height,
+                                vector_layer.width, vector_layer.height, len(layers), len(strokes), n_points))
+            f.seek(layer_off)
+            f.write(layers.tobytes())
+            f.seek(stroke_off)
+            f.write(table.tobytes())
+            f.seek(point_off)
+            for points in arrays:
+                f.write(np.ascontiguousarray(points, dtype=POINT_DTYPE).data)
+            row_bytes = canvas.width * 4
+            for layer, offset in zip(canvas.layers, pixel_offs):
+                # 타일 레이어도 전체 배열을 만들지 않도록 행 띠 단위로 모아서 쓴다
+                # 0뿐인 띠는 건너뛰어 파일 구멍(sparse)으로 남긴다, 마지막 truncate가 파일 크기를 맞춘다
+                for y in range(0, canvas.height, SAVE_BAND_ROWS):
+                    band = layer.read(0, y, canvas.width, min(y + SAVE_BAND_ROWS, canvas.height))
+                    if band.any():
+                        f.seek(offset + y * row_bytes)
+                        f.write(np.ascontiguousarray(band).data)
+            f.truncate(pixel_offs[-1] + canvas.height * canvas.width * 4 if pixel_offs else f.tell())
+        os.replace(tmp_path, path)
+    except BaseException:
+        # 쓰다가 실패하면 (읽기 전용 폴더, 디스크 부족 등) 반쯤 쓴 임시 파일을 남기지 않는다
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _band_has_data(fd, start, stop):
+    # 파일의 [start, stop) 구간에 구멍이 아닌 데이터가 있는지 (SEEK_DATA를 모르면 있다고 본다)
+    if not hasattr(os, "SEEK_DATA"):
+        return True
+    try:
+        return os.lseek(fd, start, os.SEEK_DATA) < stop
+    except OSError:
+        return False  # start 뒤로 데이터가 없음
+
+def load_document(path, mmap=True, backend="quadtree", cell_size=None, storage="dense"):
+    """
+    저장된 문서를 불러와 (Canvas, VectorLayer)를 반환
+    - mmap=True: 파일을 copy-on-write memmap으로 열어 필요한 페이지만 읽는다 (수정해도 파일은 그대로)
+    - mmap=False: 파일 전체를 한 번에 읽어 메모리에 올린다
+    - 공간 인덱스는 모든 선분을 모아 한 번에 만든다 (VectorLayer.load_strokes)
+    - storage: 레이어 저장 방식 (Canvas 참고), "dense"가 아니면 그려진 타일만 복사한다
+    - 형식이 다르거나 잘린 파일이면 ValueError
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"지원하지 않는 문서 형식입니다: {path}")
+    magic, version, _, width, height, v_width, v_height, n_layers, n_strokes, n_points = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"지원하지 않는 문서 형식입니다: {path}")
+
+    if mmap:
+        # memmap 하위 클래스는 슬라이싱이 느리므로 같은 메모리를 보는 일반 ndarray로 바꿔 쓴다
+        data = np.memmap(path, dtype=np.uint8, mode="c").view(np.ndarray)
+    else:
+        data = np.fromfile(path, dtype=np.uint8)
+    layer_off, stroke_off, point_off, pixel_offs = _layout(n_layers, n_strokes, n_points, height, width)
+    if pixel_offs:
+        end = pixel_offs[-1] + height * width * 4
+    else:
+        end = point_off + n_points * 2 * np.dtype(POINT_DTYPE).itemsize
+    if len(data) < end:
+        raise ValueError(f"문서 파일이 잘렸습니다: {path}")
+
+    def section(offset, dtype, count):
+        dtype = np.dtype(dtype)
+        return data[offset:offset + count * dtype.itemsize].view(dtype)
+
+    canvas = Canvas(width, height, storage)
+    with open(path, "rb") as f:
+        fd = f.fileno()
+        for info, offset in zip(section(layer_off, LAYER_DTYPE, n_layers), pixel_offs):
+            canvas.add_layer(info["name"].decode("utf-8", errors="replace"))
+            layer = canvas.layers[-1]
+            layer.visible = bool(info["visible"])
+            pixels = section(offset, np.uint8, height * width * 4).reshape(height, width, 4)
+            if storage == "dense":
+                layer.pixels = pixels
+                continue
+            # 타일 레이어는 저장할 때 건너뛴 (구멍으로 남은) 띠를 읽지 않고, 나머지 띠만 옮겨 쓴다
+            for y in range(0, height, SAVE_BAND_ROWS):
+                y1 = min(y + SAVE_BAND_ROWS, height)
+                if _band_has_data(fd, offset + y * width * 4, offset + y1 * width * 4):
+                    layer.write(0, y, pixels[y:y1])
+    if canvas.layers:
+        canvas.select_layer(0)
+
+    table = section(stroke_off, STROKE_DTYPE, n_strokes)
+    points = section(point_off, POINT_DTYPE, n_points * 2).reshape(-1, 2)
+    if n_strokes and (table["start"] + table["count"]).max() > n_points:
+        raise ValueError(f"stroke 점 범위가 파일을 벗어납니다: {path}")
+    strokes = []
+    for s_id, color, radius, kind, start, count, bounds in zip(
+            table["id"].tolist(), table["color"].tolist(), table["radius"].tolist(), table["kind"].tolist(),
+            table["start"].tolist(), table["count"].tolist(), table["bounds"].tolist()):
+        if kind not in STROKE_TYPES:
+            raise ValueError(f"알 수 없는 stroke 종류 {kind}: {path}")
+        stroke = STROKE_TYPES[kind].wrap(tuple(color), radius, points[start:start + count],
+                                         bounds if count else None)
+        stroke.id = s_id
+        strokes.append(stroke)
+
+    options = {} if cell_size is None else {"cell_size": cell_size}
+    vector_layer = VectorLayer(v_width, v_height, backend=backend, **options)
+    vector_layer.load_strokes(strokes)
+    return canvas, vector_layer
@@ -1,25 +1,89 @@
 # engine/history.py
 
 from collections import deque
+from .tools import CompoundCommand
 
 class History:
-    def __init__(self, max_size=50):
-        self.undo_stack = deque(maxlen=max_size)
-        self.redo_stack = deque(maxlen=max_size)
+    """
+    되돌리기/다시하기 스택
+    - max_bytes: 두 스택에 쌓인 명령들의 nbytes 합 상한, 넘으면 가장 오래된 undo부터 버린다
+    - 명령의 크기는 nbytes 속성으로 계산 (없으면 0)
+    - 스택에서 버려지는 명령은 discard(undone)가 있으면 호출해서 자원을 정리하게 한다
+    - max_size: (선택) 명령 개수 상한
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_size=None):
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self.total_bytes = 0
+        self._group = None
+
+    @staticmethod
+    def _size(command):
+        return getattr(command, "nbytes", 0)
 
     def execute(self, command):
         command.execute()
+        self.push(command)
+
+    def push(self, command):
+        # 이미 적용된 명령을 기록만 한다
+        self._clear_redo()
+        if self._group is not None:
+            self._group.append(command)
+            return
         self.undo_stack.append(command)
+        self.total_bytes += self._size(command)
+        self._trim()
+
+    def begin_group(self):
+        """
+        end_group()까지 들어오는 명령들을 하나의 되돌리기 단계로 묶는다
+        """
+        self.end_group()
+        self._group = []
+
+    def end_group(self, label=None):
+        group, self._group = self._group, None
+        if group:
+            self.push(group[0] if len(group) == 1 and label is None else CompoundCommand(group, label))
+
+    @staticmethod
+    def _discard(command, undone):
+        if hasattr(command, "discard"):
+            command.discard(undone)
+
+    def _clear_redo(self):
+        for cmd in self.redo_stack:
+            self.total_bytes -= self._size(cmd)
+            self._discard(cmd, undone=True)
         self.redo_stack.clear()
 
+    def _trim(self):
+        # 방금 실행한 명령 하나는 상한을 넘더라도 되돌릴 수 있게 남겨둔다
+        while len(self.undo_stack) > 1 and (
+            (self.max_bytes is not None and self.total_bytes > self.max_bytes) or
+            (self.max_size is not None and len(self.undo_stack) > self.max_size)
+        ):
+            cmd = self.undo_stack.popleft()
+            self.total_bytes -= self._size(cmd)
+            self._discard(cmd, undone=False)
+
     def undo(self):
+        self.end_group()
         if self.undo_stack:
             cmd = self.undo_stack.pop()
             cmd.undo()
             self.redo_stack.append(cmd)
+            return cmd
+        return None
 
     def redo(self):
+        self.end_group()
         if self.redo_stack:
             cmd = self.redo_stack.pop()
             cmd.execute()
             self.undo_stack.append(cmd)
+            return cmd
+        return None
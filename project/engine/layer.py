@@ -1,9 +1,277 @@
 # engine/layer.py
 
+import copy
+import tempfile
+import weakref
 import numpy as np
 
+TILE_SIZE = 256
+
 class Layer:
+    """
+    픽셀 전체를 하나의 (height, width, 4) 배열로 들고 있는 레이어
+    - 작은 캔버스나 파일을 통째로 memmap한 문서용, 보통은 TiledLayer를 쓴다
+    """
     def __init__(self, width, height):
+        self.width = width
+        self.height = height
         self.pixels = np.zeros((height, width, 4), dtype=np.uint8)
         self.visible = True
         self.name = "Layer"
+        self.version = 0  # 픽셀이 바뀔 때마다 증가, 합성 캐시 무효화에 사용
+
+    def touch(self):
+        self.version += 1
+
+    def read(self, x0, y0, x1, y1):
+        """
+        (x0, y0, x1, y1) 영역의 픽셀, 고친 뒤에는 write로 되돌려 써야 한다 (여기서는 view)
+        """
+        return self.pixels[y0:y1, x0:x1]
+
+    def write(self, x0, y0, pixels):
+        h, w = pixels.shape[:2]
+        np.copyto(self.pixels[y0:y0 + h, x0:x0 + w], pixels)
+
+    def snapshot(self):
+        """
+        지금 픽셀의 읽기 전용 사본 (다른 스레드에서 내보내기용)
+        """
+        snap = copy.copy(self)
+        snap.pixels = self.pixels.copy()
+        return snap
+
+    def release(self):
+        # snapshot()으로 만든 사본을 다 쓴 뒤 호출, 복사본이라 따로 돌려줄 것이 없다
+        pass
+
+    def tiles(self, rect=None):
+        """
+        저장된 픽셀 조각 (x, y, 배열)들, rect (x0, y0, x1, y1)가 주어지면 그 안으로 자른다
+        """
+        x0, y0, x1, y1 = rect or (0, 0, self.width, self.height)
+        if x0 < x1 and y0 < y1:
+            yield x0, y0, self.pixels[y0:y1, x0:x1]
+
+class TiledLayer:
+    """
+    tile_size 크기의 타일 단위로 픽셀을 저장하는 레이어 (아주 큰 캔버스용)
+    - 타일은 처음 쓸 때 할당하고, 한 번도 그리지 않은 타일은 저장하지 않는다 (읽으면 투명)
+    - 새 레이어는 그리기 전까지 메모리를 쓰지 않고, 합성할 때도 occupied 타일만 본다
+    - scratch=True 이면 타일을 임시 파일 위의 np.memmap 칸(slot)에 두어, 메모리 대신 디스크(페이지 캐시)를 쓴다
+    """
+    def __init__(self, width, height, tile_size=TILE_SIZE, scratch=False, scratch_dir=None):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.rows = -(-height // tile_size)
+        self.cols = -(-width // tile_size)
+        self.tile_map = {}  # (ty, tx) -> (th, tw, 4) 배열
+        self.occupied = set()  # 알파가 0이 아닌 픽셀이 있는 타일 (ty, tx), 합성은 이 타일만 본다
+        self.visible = True
+        self.name = "Layer"
+        self.version = 0
+
+        # snapshot()과 공유 중인 타일 (쓰기 전에 복사), 살아있는 사본 수
+        self._shared = set()
+        self._snapshots = 0
+        self._release = None  # 사본에서만: 원본에 사본이 끝났음을 알리는 weakref.finalize
+
+        # memmap 칸 관리: 타일 -> 칸 번호, 빈 칸, 사본이 아직 읽을 수 있어 사본이 끝나면 비울 칸
+        self._store = None
+        self._slot_of = {}
+        self._free_slots = []
+        self._retired_slots = []
+        if scratch:
+            # 파일 크기만 잡아두므로 (sparse 파일) 실제로 쓴 타일만 디스크를 차지한다
+            self._file = tempfile.TemporaryFile(dir=scratch_dir)
+            self._grow_store(self.rows * self.cols)
+
+    def touch(self):
+        self.version += 1
+
+    def _tile_rect(self, ty, tx):
+        ts = self.tile_size
+        x0, y0 = tx * ts, ty * ts
+        return x0, y0, min(x0 + ts, self.width), min(y0 + ts, self.height)
+
+    def _tile_range(self, x0, y0, x1, y1):
+        ts = self.tile_size
+        for ty in range(max(0, y0 // ts), min(self.rows, -(-y1 // ts))):
+            for tx in range(max(0, x0 // ts), min(self.cols, -(-x1 // ts))):
+                yield ty, tx
+
+    def _grow_store(self, capacity):
+        # 칸 수를 capacity로 늘린다, 이미 나눠준 타일은 이전 매핑의 view로 그대로 유효하다
+        ts = self.tile_size
+        old = 0 if self._store is None else len(self._store)
+        self._file.truncate(capacity * ts * ts * 4)
+        self._store = np.memmap(self._file, dtype=np.uint8, mode="r+", shape=(capacity, ts, ts, 4))
+        self._free_slots.extend(range(capacity - 1, old - 1, -1))
+
+    def _take_slot(self, key):
+        # key 타일에 빈 memmap 칸을 주고 그 칸의 view를 반환 (빈 칸이 없으면 파일을 늘린다)
+        if not self._free_slots:
+            self._grow_store(len(self._store) * 2)
+        slot = self._free_slots.pop()
+        self._slot_of[key] = slot
+        x0, y0, x1, y1 = self._tile_rect(*key)
+        return self._store[slot, :y1 - y0, :x1 - x0].view(np.ndarray)
+
+    def _drop_slot(self, key):
+        # key 타일이 쓰던 칸을 돌려준다, 사본이 읽고 있을 수 있으면 사본이 끝날 때까지 미룬다
+        slot = self._slot_of.pop(key, None)
+        if slot is None:
+            return
+        if key in self._shared:
+            self._retired_slots.append(slot)
+        else:
+            self._free_slots.append(slot)
+
+    def _allocate(self, ty, tx):
+        x0, y0, x1, y1 = self._tile_rect(ty, tx)
+        if self._store is not None:
+            tile = self._take_slot((ty, tx))
+            tile.fill(0)
+        else:
+            tile = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+        self._shared.discard((ty, tx))
+        self.tile_map[(ty, tx)] = tile
+        return tile
+
+    def _unshare(self, key):
+        # 사본과 공유 중인 타일을 쓰기 전에 복사한다 (memmap이면 새 칸으로)
+        tile = self.tile_map[key]
+        if self._store is not None:
+            self._drop_slot(key)
+            copied = self._take_slot(key)
+            copied[...] = tile
+        else:
+            copied = tile.copy()
+        self._shared.discard(key)
+        self.tile_map[key] = copied
+        return copied
+
+    def _remove(self, key):
+        del self.tile_map[key]
+        self._drop_slot(key)
+        self._shared.discard(key)
+
+    def _clipped(self, keys, rect):
+        # keys 타일들 중 rect와 겹치는 부분 (x, y, 배열)
+        x0, y0, x1, y1 = rect
+        ts = self.tile_size
+        ty0, ty1 = max(0, y0 // ts), min(self.rows, -(-y1 // ts))
+        tx0, tx1 = max(0, x0 // ts), min(self.cols, -(-x1 // ts))
+        if len(keys) < (ty1 - ty0) * (tx1 - tx0):
+            # 영역보다 타일이 적으면 (보통의 sparse 레이어) 타일 쪽을 훑는다
+            found = sorted(key for key in keys if ty0 <= key[0] < ty1 and tx0 <= key[1] < tx1)
+        else:
+            found = [key for key in self._tile_range(x0, y0, x1, y1) if key in keys]
+        for ty, tx in found:
+            tile = self.tile_map[(ty, tx)]
+            bx0, by0, bx1, by1 = self._tile_rect(ty, tx)
+            cx0, cy0 = max(bx0, x0), max(by0, y0)
+            cx1, cy1 = min(bx1, x1), min(by1, y1)
+            if cx0 < cx1 and cy0 < cy1:
+                yield cx0, cy0, tile[cy0 - by0:cy1 - by0, cx0 - bx0:cx1 - bx0]
+
+    def read(self, x0, y0, x1, y1):
+        """
+        (x0, y0, x1, y1) 영역의 픽셀을 새 배열로 모아서 반환 (없는 타일은 투명)
+        """
+        out = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+        for tx0, ty0, tile in self._clipped(self.tile_map, (x0, y0, x1, y1)):
+            h, w = tile.shape[:2]
+            out[ty0 - y0:ty0 - y0 + h, tx0 - x0:tx0 - x0 + w] = tile
+        return out
+
+    def write(self, x0, y0, pixels):
+        """
+        (x0, y0)부터 pixels를 덮어쓰기
+        - 아직 없는 타일은 쓸 내용이 있을 때만 할당하고, 다 지워져 0만 남은 타일은 해제한다
+        - 알파가 0이 아닌 픽셀이 있는 타일만 occupied에 남긴다
+        """
+        h, w = pixels.shape[:2]
+        for ty, tx in self._tile_range(x0, y0, x0 + w, y0 + h):
+            key = (ty, tx)
+            bx0, by0, bx1, by1 = self._tile_rect(ty, tx)
+            cx0, cy0 = max(bx0, x0), max(by0, y0)
+            cx1, cy1 = min(bx1, x0 + w), min(by1, y0 + h)
+            src = pixels[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+            tile = self.tile_map.get(key)
+            if tile is None:
+                if not src.any():
+                    continue
+                tile = self._allocate(ty, tx)
+            elif key in self._shared:
+                tile = self._unshare(key)
+            tile[cy0 - by0:cy1 - by0, cx0 - bx0:cx1 - bx0] = src
+
+            # 쓴 부분에 알파가 있으면 바로 occupied, 없으면 (지운 경우) 타일 전체를 다시 확인
+            if src[:, :, 3].any():
+                self.occupied.add(key)
+                continue
+            if key in self.occupied and not tile[:, :, 3].any():
+                self.occupied.discard(key)
+            if key not in self.occupied and not tile.any():
+                self._remove(key)
+
+    def tiles(self, rect=None):
+        """
+        비어있지 않은 (occupied) 타일 (x, y, 배열)들, rect (x0, y0, x1, y1)가 주어지면 그 안으로 잘라서
+        """
+        return self._clipped(self.occupied, rect or (0, 0, self.width, self.height))
+
+    def snapshot(self):
+        """
+        지금 픽셀의 읽기 전용 사본 (다른 스레드에서 내보내기용)
+        - 타일 배열을 복사하지 않고 공유하며, 이 레이어가 공유 중인 타일에 쓸 때 그 타일만 복사한다
+        - memmap 타일은 다른 빈 칸으로 복사되고, 원래 칸은 사본이 끝날 때 (release 또는 GC) 돌려받는다
+        """
+        snap = copy.copy(self)
+        snap.tile_map = dict(self.tile_map)
+        snap.occupied = set(self.occupied)
+        snap._shared = set()
+        snap._snapshots = 0
+        snap._store = None
+        snap._slot_of, snap._free_slots, snap._retired_slots = {}, [], []
+        self._shared = set(self.tile_map)
+        self._snapshots += 1
+        snap._release = weakref.finalize(snap, self._snapshot_released)
+        return snap
+
+    def release(self):
+        """
+        snapshot()으로 만든 사본을 다 쓴 뒤 호출 (원본 레이어가 공유하던 타일과 memmap 칸을 돌려받는다)
+        - 호출하지 않아도 사본이 GC될 때 같은 일이 일어난다
+        """
+        if self._release is not None:
+            self._release()
+
+    def _snapshot_released(self):
+        self._snapshots -= 1
+        if self._snapshots:
+            return
+        # 살아있는 사본이 없으면 공유 표시를 지우고, 미뤄둔 칸을 빈 칸으로 돌린다
+        self._shared = set()
+        self._free_slots.extend(self._retired_slots)
+        self._retired_slots = []
+
+    @property
+    def nbytes(self):
+        return sum(tile.nbytes for tile in self.tile_map.values())
+
+    @property
+    def pixels(self):
+        # 호환용: 레이어 전체를 하나의 배열로 모은다 (큰 캔버스에서는 read/tiles를 쓸 것)
+        return self.read(0, 0, self.width, self.height)
+
+    @pixels.setter
+    def pixels(self, pixels):
+        for key in list(self.tile_map):
+            self._remove(key)
+        self.occupied = set()
+        ts = self.tile_size
+        for y in range(0, self.height, ts):
+            self.write(0, y, pixels[y:y + ts])
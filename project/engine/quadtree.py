@@ -1,56 +1,200 @@
 # engine/quadtree.py
 
+import math
 import pygame
+from engine.spatial import SpatialIndex, segment_distance_sq, capsule_box
 
-class QuadtreeNode:
-    def __init__(self, x, y, width, height, capacity=4):
+# 같은 좌표에 선분이 몰려도 분할이 끝나도록 하는 한계
+MAX_DEPTH = 16
+MIN_SIZE = 2
+
+class QuadtreeNode(SpatialIndex):
+    """
+    stroke의 선분을 캡슐(선분 + 반폭)로 저장하는 loose quadtree
+    - 노드마다 경계를 크기의 절반씩 넓힌 loose 영역이 있고, 캡슐은 bounding box 중심이 든 자식의
+      loose 영역에 완전히 들어가면 그 자식으로 내려간다 (분할선에 걸친 짧은 선분도 깊이 내려간다)
+    - 캔버스 가장자리에 닿는 loose 영역은 바깥쪽으로 끝이 없으므로, 반폭 때문에 캔버스 밖으로
+      나가는 선분도 루트에 쌓이지 않는다
+    - MAX_DEPTH 이거나 MIN_SIZE 보다 작게 나눠야 하는 노드는 용량을 넘어도 분할하지 않는다
+    - 질의는 재귀 대신 명시적 스택으로 노드를 순회한다
+    """
+    def __init__(self, x, y, width, height, capacity=4, depth=0):
         self.boundary = pygame.Rect(x, y, width, height)
         self.capacity = capacity
-        self.points = []  # (stroke_idx, point_idx, x, y)
+        self.depth = depth
+        self.points = []  # (stroke_id, seg_idx, x0, y0, x1, y1, half_width)
         self.divided = False
+        # 저장된 캡슐이 모두 들어가는 영역 (left, top, right, bottom), 루트는 끝이 없다
+        self.loose = (-math.inf, -math.inf, math.inf, math.inf)
 
-    def insert(self, stroke_idx, point_idx, x, y):
-        if not self.boundary.collidepoint(x, y):
-            return False
-        if len(self.points) < self.capacity:
-            self.points.append((stroke_idx, point_idx, x, y))
+    def _contains(self, x0, y0, x1, y1, hw):
+        left, top, right, bottom = self.loose
+        return (left <= min(x0, x1) - hw and max(x0, x1) + hw <= right and
+                top <= min(y0, y1) - hw and max(y0, y1) + hw <= bottom)
+
+    def _child_for(self, x0, y0, x1, y1, hw):
+        # bounding box 중심이 든 자식 하나만 후보이므로 삽입과 삭제가 같은 경로를 따른다
+        x, y, w, h = self.boundary
+        east = x0 + x1 >= 2 * x + 2 * (w // 2)
+        south = y0 + y1 >= 2 * y + 2 * (h // 2)
+        child = self.children[2 * south + east]
+        return child if child._contains(x0, y0, x1, y1, hw) else None
+
+    def insert(self, stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+        item = (stroke_id, seg_idx, x0, y0, x1, y1, half_width)
+        if not self.divided and (len(self.points) < self.capacity or not self._can_subdivide()):
+            self.points.append(item)
             return True
         if not self.divided:
             self.subdivide()
-        return (
-            self.nw.insert(stroke_idx, point_idx, x, y) or
-            self.ne.insert(stroke_idx, point_idx, x, y) or
-            self.sw.insert(stroke_idx, point_idx, x, y) or
-            self.se.insert(stroke_idx, point_idx, x, y)
-        )
+            # 잎일 때 모아둔 선분도 들어갈 수 있는 자식으로 내려보낸다
+            items, self.points = self.points, []
+            for stored in items:
+                self._insert_divided(stored)
+        return self._insert_divided(item)
+
+    def _insert_divided(self, item):
+        # 어느 자식에도 완전히 들어가지 않는 선분은 이 노드에 남긴다
+        child = self._child_for(*item[2:])
+        if child is None:
+            self.points.append(item)
+            return True
+        return child.insert(*item)
+
+    def remove(self, stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+        # 삽입 경로를 그대로 따라 내려가므로 해당 선분이 속한 노드만 방문한다
+        item = (stroke_id, seg_idx, x0, y0, x1, y1, half_width)
+        for i, entry in enumerate(self.points):
+            if entry == item:
+                self.points.pop(i)
+                if self.divided:
+                    self._merge()
+                return True
+        if not self.divided:
+            return False
+        child = self._child_for(x0, y0, x1, y1, half_width)
+        if child is None or not child.remove(*item):
+            return False
+        self._merge()
+        return True
+
+    def update(self, stroke_id, seg_idx, old_segment, new_segment):
+        """
+        old_segment, new_segment: (x0, y0, x1, y1, half_width)
+        """
+        if not self.remove(stroke_id, seg_idx, *old_segment):
+            return False
+        return self.insert(stroke_id, seg_idx, *new_segment)
+
+    def _can_subdivide(self):
+        return self.depth < MAX_DEPTH and min(self.boundary.width, self.boundary.height) >= 2 * MIN_SIZE
 
     def subdivide(self):
         x, y, w, h = self.boundary
         hw, hh = w // 2, h // 2
-        self.nw = QuadtreeNode(x, y, hw, hh)
-        self.ne = QuadtreeNode(x + hw, y, hw, hh)
-        self.sw = QuadtreeNode(x, y + hh, hw, hh)
-        self.se = QuadtreeNode(x + hw, y + hh, hw, hh)
+        depth = self.depth + 1
+        self.nw = QuadtreeNode(x, y, hw, hh, self.capacity, depth)
+        self.ne = QuadtreeNode(x + hw, y, w - hw, hh, self.capacity, depth)
+        self.sw = QuadtreeNode(x, y + hh, hw, h - hh, self.capacity, depth)
+        self.se = QuadtreeNode(x + hw, y + hh, w - hw, h - hh, self.capacity, depth)
+        self.children = (self.nw, self.ne, self.sw, self.se)
+        for child in self.children:
+            child._loosen(self)
         self.divided = True
 
-    def query_circle(self, cx, cy, radius):
-        found = []
-        if not self._intersects_circle(cx, cy, radius):
-            return found
-        for s_idx, p_idx, px, py in self.points:
-            if (px - cx)**2 + (py - cy)**2 <= radius**2:
-                found.append((s_idx, p_idx, px, py))
-        if self.divided:
-            found += self.nw.query_circle(cx, cy, radius)
-            found += self.ne.query_circle(cx, cy, radius)
-            found += self.sw.query_circle(cx, cy, radius)
-            found += self.se.query_circle(cx, cy, radius)
+    def _loosen(self, parent):
+        # 경계를 크기의 절반씩 넓히되, 부모의 끝없는 변에 붙어 있는 변은 그대로 끝없이 둔다
+        x, y, w, h = self.boundary
+        px, py, pw, ph = parent.boundary
+        pl, pt, pr, pb = parent.loose
+        mx, my = w / 2, h / 2
+        self.loose = (pl if x == px and pl == -math.inf else x - mx,
+                      pt if y == py and pt == -math.inf else y - my,
+                      pr if x + w == px + pw and pr == math.inf else x + w + mx,
+                      pb if y + h == py + ph and pb == math.inf else y + h + my)
+
+    def _merge(self):
+        # 자식들이 모두 잎이고 남은 선분이 용량 이하이면 다시 하나의 노드로 합친다
+        children = self.children
+        if any(child.divided for child in children):
+            return
+        total = len(self.points) + sum(len(child.points) for child in children)
+        if total > self.capacity:
+            return
+        for child in children:
+            self.points.extend(child.points)
+        del self.nw, self.ne, self.sw, self.se, self.children
+        self.divided = False
+
+    def iter_circle(self, cx, cy, radius):
+        """
+        원 (cx, cy, radius)과 겹치는 캡슐을 하나씩 yield, 중간에 멈추면 나머지 노드는 방문하지 않는다
+        """
+        # 노드에 저장된 캡슐은 노드의 loose 영역 안에 완전히 들어가므로 그 영역과 만나지 않으면 건너뛴다
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for s_id, seg_idx, x0, y0, x1, y1, hw in node.points:
+                if segment_distance_sq(cx, cy, x0, y0, x1, y1) <= (radius + hw) ** 2:
+                    yield s_id, seg_idx, x0, y0, x1, y1
+            if node.divided:
+                for child in node.children:
+                    if child._intersects_circle(cx, cy, radius):
+                        stack.append(child)
+
+    def query_circle(self, cx, cy, radius, out=None):
+        """
+        원 (cx, cy, radius)과 겹치는 캡슐들의 (stroke_id, seg_idx, x0, y0, x1, y1) 목록
+        - out 리스트를 넘기면 새로 만들지 않고 그 뒤에 이어 붙인다
+        """
+        found = [] if out is None else out
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for s_id, seg_idx, x0, y0, x1, y1, hw in node.points:
+                if segment_distance_sq(cx, cy, x0, y0, x1, y1) <= (radius + hw) ** 2:
+                    found.append((s_id, seg_idx, x0, y0, x1, y1))
+            if node.divided:
+                for child in node.children:
+                    if child._intersects_circle(cx, cy, radius):
+                        stack.append(child)
+        return found
+
+    def query_stroke_ids(self, cx, cy, radius, out=None):
+        # 이미 찾은 stroke의 다른 선분은 거리 계산을 건너뛴다
+        found = set() if out is None else out
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for s_id, seg_idx, x0, y0, x1, y1, hw in node.points:
+                if s_id not in found and segment_distance_sq(cx, cy, x0, y0, x1, y1) <= (radius + hw) ** 2:
+                    found.add(s_id)
+            if node.divided:
+                for child in node.children:
+                    if child._intersects_circle(cx, cy, radius):
+                        stack.append(child)
+        return found
+
+    def query_rect(self, left, top, right, bottom, out=None):
+        found = [] if out is None else out
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for s_id, seg_idx, x0, y0, x1, y1, hw in node.points:
+                bl, bt, br, bb = capsule_box(x0, y0, x1, y1, hw)
+                if bl <= right and br >= left and bt <= bottom and bb >= top:
+                    found.append((s_id, seg_idx, x0, y0, x1, y1))
+            if node.divided:
+                for child in node.children:
+                    cl, ct, cr, cb = child.loose
+                    if cl <= right and cr >= left and ct <= bottom and cb >= top:
+                        stack.append(child)
         return found
 
     def _intersects_circle(self, cx, cy, r):
-        x, y, w, h = self.boundary
-        closest_x = max(x, min(cx, x + w))
-        closest_y = max(y, min(cy, y + h))
+        left, top, right, bottom = self.loose
+        closest_x = max(left, min(cx, right))
+        closest_y = max(top, min(cy, bottom))
         dx, dy = closest_x - cx, closest_y - cy
         return dx * dx + dy * dy <= r * r
 
@@ -60,7 +204,5 @@ class QuadtreeNode:
                            self.boundary.width, self.boundary.height)
         pygame.draw.rect(surface, color, rect, thickness)
         if self.divided:
-            self.nw.draw(surface, color, thickness, offset)
-            self.ne.draw(surface, color, thickness, offset)
-            self.sw.draw(surface, color, thickness, offset)
-            self.se.draw(surface, color, thickness, offset)
+            for child in self.children:
+                child.draw(surface, color, thickness, offset)
@@ -0,0 +1,196 @@
+# engine/rtree.py
+
+import numpy as np
+import pygame
+from engine.spatial import SpatialIndex
+from engine.quadtree import QuadtreeNode
+
+NODE_SIZE = 16
+# 제거된 선분이 packed 선분의 이 비율을 넘으면 남은 선분으로 다시 묶는다
+REPACK_FRACTION = 0.5
+
+def stroke_segment_arrays(strokes):
+    """
+    stroke들의 선분을 NumPy 배열로 모으기 (점 하나짜리 stroke는 길이 0인 선분 하나)
+    반환값: (stroke_ids, seg_idx, (N, 4) 선분 x0 y0 x1 y1, half_widths)
+    - 모든 점을 한 배열로 이어 붙인 뒤 stroke 경계만 빼고 한꺼번에 선분을 만든다
+    """
+    arrays = [stroke.points for stroke in strokes]
+    strokes = [stroke for stroke, points in zip(strokes, arrays) if len(points)]
+    arrays = [points for points in arrays if len(points)]
+    if not strokes:
+        return (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros((0, 4)), np.zeros(0))
+    counts = np.array([len(points) for points in arrays])
+    points = np.concatenate(arrays).astype(np.float64)
+    ends = np.cumsum(counts)
+    owner = np.repeat(np.arange(len(strokes)), counts)
+
+    is_last = np.zeros(len(points), dtype=bool)
+    is_last[ends - 1] = True
+    first = np.flatnonzero(~is_last | (counts[owner] == 1))
+    second = np.where(is_last[first], first, first + 1)
+    owner = owner[first]
+
+    ids = np.array([stroke.id for stroke in strokes], dtype=np.int64)[owner]
+    half_widths = np.array([max(1, stroke.radius) / 2 for stroke in strokes])[owner]
+    seg_idx = first - (ends - counts)[owner]
+    return ids, seg_idx.astype(np.int64), np.hstack((points[first], points[second])), half_widths
+
+class PackedRTree(SpatialIndex):
+    """
+    NumPy 배열에서 한 번에 만드는 정적 R-tree (Sort-Tile-Recursive 방식으로 잎 정렬)
+    - 각 노드는 NODE_SIZE 개의 연속된 자식을 가지므로 자식 위치를 저장하지 않는다
+    - 질의는 레벨 단위로 후보 노드 전체를 한꺼번에 검사한다
+    - 만든 뒤 추가되는 선분은 overflow 인덱스(기본 QuadtreeNode)에, 제거된 선분은 tombstone 집합에 둔다
+    - tombstone이 REPACK_FRACTION을 넘으면 남은 선분만으로 다시 묶는다
+    """
+    def __init__(self, stroke_ids, seg_idx, segments, half_widths, width, height,
+                 overflow=None, node_size=NODE_SIZE):
+        self.width = width
+        self.height = height
+        self.node_size = node_size
+        self.overflow = overflow if overflow is not None else QuadtreeNode(0, 0, width, height)
+        self._pack(stroke_ids, seg_idx, segments, half_widths)
+
+    def _pack(self, stroke_ids, seg_idx, segments, half_widths):
+        self.removed = set()  # (stroke_id, seg_idx)
+        self._keys = None  # remove에서 처음 찾을 때 만드는 정렬된 (stroke_id, seg_idx) 키
+        node_size = self.node_size
+
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        half_widths = np.asarray(half_widths, dtype=np.float64)
+        n = len(segments)
+        boxes = np.empty((n, 4))
+        boxes[:, 0] = np.minimum(segments[:, 0], segments[:, 2]) - half_widths
+        boxes[:, 1] = np.minimum(segments[:, 1], segments[:, 3]) - half_widths
+        boxes[:, 2] = np.maximum(segments[:, 0], segments[:, 2]) + half_widths
+        boxes[:, 3] = np.maximum(segments[:, 1], segments[:, 3]) + half_widths
+
+        # STR: x 중심으로 세로 띠를 나누고, 띠 안에서는 y 중심으로 정렬
+        # 띠는 개수가 아닌 폭을 같게 나눠서, (띠 번호, y) 정렬을 한 번의 argsort로 끝낸다
+        order = np.arange(n)
+        if n:
+            strips = int(np.ceil(np.sqrt(-(-n // node_size))))
+            cx = boxes[:, 0] + boxes[:, 2]
+            cy = boxes[:, 1] + boxes[:, 3]
+            x_min, x_span = cx.min(), max(np.ptp(cx), 1e-9)
+            y_min, y_span = cy.min(), max(np.ptp(cy), 1e-9)
+            strip = np.minimum((cx - x_min) * (strips / x_span), strips - 1).astype(np.int64)
+            order = np.argsort(strip + (cy - y_min) * (0.5 / y_span))
+
+        self.stroke_ids = np.asarray(stroke_ids, dtype=np.int64)[order]
+        self.seg_idx = np.asarray(seg_idx, dtype=np.int64)[order]
+        self.segments = segments[order]
+        self.half_widths = half_widths[order]
+
+        # levels[0]: 잎 노드 박스, levels[-1]: 루트 바로 아래 노드들 (node_size 개 이하)
+        self.levels = []
+        level = boxes[order]
+        while len(level) > node_size or not self.levels:
+            starts = np.arange(0, len(level), node_size)
+            if not len(level):
+                parents = np.zeros((0, 4))
+            else:
+                parents = np.column_stack((
+                    np.minimum.reduceat(level[:, 0], starts), np.minimum.reduceat(level[:, 1], starts),
+                    np.maximum.reduceat(level[:, 2], starts), np.maximum.reduceat(level[:, 3], starts)))
+            self.levels.append(parents)
+            level = parents
+
+    @classmethod
+    def from_strokes(cls, strokes, width, height, overflow=None, node_size=NODE_SIZE):
+        return cls(*stroke_segment_arrays(strokes), width, height, overflow, node_size)
+
+    def insert(self, stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+        return self.overflow.insert(stroke_id, seg_idx, x0, y0, x1, y1, half_width)
+
+    def remove(self, stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+        if self.overflow.remove(stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+            return True
+        if (stroke_id, seg_idx) in self.removed or not self._is_packed(stroke_id, seg_idx):
+            return False
+        self.removed.add((stroke_id, seg_idx))
+        if len(self.removed) > len(self.segments) * REPACK_FRACTION:
+            self.repack()
+        return True
+
+    def _row_keys(self):
+        # 행마다 (stroke_id, seg_idx)를 정수 하나로 (seg_idx는 32비트 안에 들어간다고 본다)
+        return (self.stroke_ids << 32) | self.seg_idx
+
+    def _is_packed(self, stroke_id, seg_idx):
+        if self._keys is None:
+            self._keys = np.sort(self._row_keys())
+        key = (stroke_id << 32) | seg_idx
+        i = int(np.searchsorted(self._keys, key))
+        return i < len(self._keys) and int(self._keys[i]) == key
+
+    def repack(self):
+        """
+        tombstone으로 남은 선분을 빼고 packed 배열과 노드를 다시 만든다
+        """
+        if not self.removed:
+            return
+        removed = np.array([(s_id << 32) | seg_idx for s_id, seg_idx in self.removed], dtype=np.int64)
+        keep = ~np.isin(self._row_keys(), removed)
+        self._pack(self.stroke_ids[keep], self.seg_idx[keep], self.segments[keep], self.half_widths[keep])
+
+    def _candidates(self, x0, y0, x1, y1):
+        """
+        박스 (x0, y0, x1, y1)와 bounding box가 겹치는 선분의 행 번호, 레벨마다 벡터화
+        """
+        b = self.node_size
+        nodes = np.arange(len(self.levels[-1]))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[depth][nodes]
+            nodes = nodes[(boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) &
+                          (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)]
+            size = len(self.levels[depth - 1]) if depth else len(self.segments)
+            children = (nodes[:, None] * b + np.arange(b)).ravel()
+            nodes = children[children < size]
+        return nodes
+
+    def query_circle(self, cx, cy, radius, out=None):
+        """
+        원 (cx, cy, radius)과 겹치는 캡슐들의 (stroke_id, seg_idx, x0, y0, x1, y1) 목록
+        """
+        rows = self._candidates(cx - radius, cy - radius, cx + radius, cy + radius)
+        found = self.overflow.query_circle(cx, cy, radius, out)
+        if not len(rows):
+            return found
+
+        seg = self.segments[rows]
+        d = seg[:, 2:] - seg[:, :2]
+        f = np.array((cx, cy)) - seg[:, :2]
+        length_sq = (d * d).sum(axis=1)
+        t = np.clip((f * d).sum(axis=1) / np.where(length_sq > 0, length_sq, 1), 0, 1)
+        e = seg[:, :2] + t[:, None] * d - (cx, cy)
+        hit = (e * e).sum(axis=1) <= (radius + self.half_widths[rows]) ** 2
+        rows = rows[hit]
+
+        for s_id, seg_idx, (x0, y0, x1, y1) in zip(self.stroke_ids[rows].tolist(), self.seg_idx[rows].tolist(),
+                                                    self.segments[rows].tolist()):
+            if (s_id, seg_idx) not in self.removed:
+                found.append((s_id, seg_idx, x0, y0, x1, y1))
+        return found
+
+    def query_rect(self, left, top, right, bottom, out=None):
+        found = self.overflow.query_rect(left, top, right, bottom, out)
+        rows = self._candidates(left, top, right, bottom)
+        seg, hw = self.segments[rows], self.half_widths[rows]
+        rows = rows[(np.minimum(seg[:, 0], seg[:, 2]) - hw <= right) & (np.maximum(seg[:, 0], seg[:, 2]) + hw >= left) &
+                    (np.minimum(seg[:, 1], seg[:, 3]) - hw <= bottom) & (np.maximum(seg[:, 1], seg[:, 3]) + hw >= top)]
+        for s_id, seg_idx, (x0, y0, x1, y1) in zip(self.stroke_ids[rows].tolist(), self.seg_idx[rows].tolist(),
+                                                    self.segments[rows].tolist()):
+            if (s_id, seg_idx) not in self.removed:
+                found.append((s_id, seg_idx, x0, y0, x1, y1))
+        return found
+
+    def draw(self, surface, color=(100, 200, 255), thickness=1, offset=(0, 0)):
+        # 잎 바로 위 레벨부터 노드 박스를 그린다 (잎은 너무 많아서 생략)
+        ox, oy = offset
+        for level in self.levels[1:]:
+            for x0, y0, x1, y1 in level.tolist():
+                rect = pygame.Rect(int(x0) + ox, int(y0) + oy, int(x1 - x0) + 1, int(y1 - y0) + 1)
+                pygame.draw.rect(surface, color, rect, thickness)
+        self.overflow.draw(surface, color, thickness, offset)
@@ -0,0 +1,71 @@
+# engine/simplify.py
+
+import numpy as np
+
+def rdp_mask(points, tolerance):
+    """
+    Ramer-Douglas-Peucker 단순화에서 남길 점을 True로 표시한 마스크
+    - 재귀 대신 명시적 스택을 쓰고, 구간 안의 거리 계산은 NumPy로 한 번에 한다
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        inner = points[start + 1:end]
+        # 선분 a-b 까지의 거리 (engine.spatial.segment_distance_sq 의 벡터화), 되돌아오는 점도 잡는다
+        ab = b - a
+        ap = inner - a
+        length_sq = float(ab @ ab)
+        t = np.zeros(len(inner))
+        if length_sq > 0:
+            t = np.clip(ap @ ab / length_sq, 0.0, 1.0)
+        dist = np.hypot(*(ap - t[:, None] * ab).T)
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+# max_deviation에서 한 번에 계산할 (점 수 x 선분 수)의 상한
+MAX_DISTANCE_PAIRS = 1 << 20
+
+def polyline_distance(points, polyline):
+    """
+    각 점에서 polyline까지의 최소 거리 (점 단위 벡터화, 점 묶음마다 모든 선분과 비교)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    polyline = np.asarray(polyline, dtype=np.float64).reshape(-1, 2)
+    if len(polyline) == 1:
+        return np.hypot(*(points - polyline[0]).T)
+    a, ab = polyline[:-1], np.diff(polyline, axis=0)
+    length_sq = (ab * ab).sum(axis=1)
+    out = np.empty(len(points))
+    chunk = max(1, MAX_DISTANCE_PAIRS // len(a))
+    for start in range(0, len(points), chunk):
+        ap = points[start:start + chunk, None, :] - a
+        t = np.clip((ap * ab).sum(axis=2) / np.where(length_sq > 0, length_sq, 1), 0.0, 1.0)
+        e = ap - t[:, :, None] * ab
+        out[start:start + chunk] = np.sqrt((e * e).sum(axis=2).min(axis=1))
+    return out
+
+def max_deviation(a, b):
+    """
+    두 polyline이 서로에게서 가장 멀리 벗어난 거리 (양방향)
+    """
+    if not len(a) or not len(b):
+        return 0.0 if len(a) == len(b) else np.inf
+    return max(polyline_distance(a, b).max(), polyline_distance(b, a).max())
+
+def simplify_points(points, tolerance):
+    return np.asarray(points)[rdp_mask(points, tolerance)]
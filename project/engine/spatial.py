@@ -0,0 +1,61 @@
+# engine/spatial.py
+
+def segment_distance_sq(px, py, x0, y0, x1, y1):
+    """
+    점 (px, py)에서 선분 (x0, y0)-(x1, y1)까지의 거리의 제곱
+    """
+    dx, dy = x1 - x0, y1 - y0
+    length_sq = dx * dx + dy * dy
+    t = 0.0
+    if length_sq > 0:
+        t = max(0.0, min(1.0, ((px - x0) * dx + (py - y0) * dy) / length_sq))
+    ex, ey = x0 + t * dx - px, y0 + t * dy - py
+    return ex * ex + ey * ey
+
+def capsule_box(x0, y0, x1, y1, half_width):
+    # 캡슐의 bounding box (left, top, right, bottom)
+    return (min(x0, x1) - half_width, min(y0, y1) - half_width,
+            max(x0, x1) + half_width, max(y0, y1) + half_width)
+
+class SpatialIndex:
+    """
+    VectorLayer가 사용하는 선분(캡슐) 공간 인덱스의 공통 인터페이스
+    - 항목: (stroke_id, seg_idx, x0, y0, x1, y1, half_width)
+    - 질의 결과: (stroke_id, seg_idx, x0, y0, x1, y1) 목록
+    """
+    def insert(self, stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+        raise NotImplementedError
+
+    def remove(self, stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+        raise NotImplementedError
+
+    def query_circle(self, cx, cy, radius, out=None):
+        """
+        원 (cx, cy, radius)과 겹치는 캡슐들 (out 리스트를 넘기면 거기에 이어 붙인다)
+        """
+        raise NotImplementedError
+
+    def query_rect(self, left, top, right, bottom, out=None):
+        """
+        bounding box가 사각형 [left, right] x [top, bottom]과 겹치는 캡슐들
+        """
+        raise NotImplementedError
+
+    def iter_circle(self, cx, cy, radius):
+        yield from self.query_circle(cx, cy, radius)
+
+    def query_stroke_ids(self, cx, cy, radius, out=None):
+        """
+        원과 겹치는 캡슐을 가진 stroke ID 집합 (out 집합을 넘기면 거기에 추가)
+        """
+        found = set() if out is None else out
+        found.update(s_id for s_id, *_ in self.query_circle(cx, cy, radius))
+        return found
+
+    def any_hit(self, cx, cy, radius):
+        # 하나라도 찾으면 바로 멈춘다
+        return next(self.iter_circle(cx, cy, radius), None) is not None
+
+    def draw(self, surface, color=(100, 200, 255), thickness=1, offset=(0, 0)):
+        # 디버그용 시각화, 기본은 아무것도 그리지 않는다
+        pass
@@ -0,0 +1,92 @@
+# engine/spatial_hash.py
+
+import pygame
+from engine.spatial import SpatialIndex, segment_distance_sq, capsule_box
+
+CELL_SIZE = 32
+
+class SpatialHash(SpatialIndex):
+    """
+    고정 크기 격자에 선분을 나눠 담는 공간 해시
+    - 캡슐의 bounding box가 걸치는 모든 칸에 등록한다
+    - 칸 크기가 지우개 지름 이상이면 원 질의는 최대 4칸만 본다
+      (지우개 크기가 바뀌면 rebucket으로 칸 크기를 다시 맞춘다, VectorLayer.fit_cell_size 참고)
+    """
+    def __init__(self, width, height, cell_size=CELL_SIZE):
+        self.width = width
+        self.height = height
+        self.cell_size = max(1, int(cell_size))
+        self.cells = {}  # (cx, cy) -> {(stroke_id, seg_idx): item}
+
+    def _cells(self, left, top, right, bottom):
+        cs = self.cell_size
+        for cy in range(int(top // cs), int(bottom // cs) + 1):
+            for cx in range(int(left // cs), int(right // cs) + 1):
+                yield cx, cy
+
+    def insert(self, stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+        item = (stroke_id, seg_idx, x0, y0, x1, y1, half_width)
+        for key in self._cells(*capsule_box(x0, y0, x1, y1, half_width)):
+            self.cells.setdefault(key, {})[stroke_id, seg_idx] = item
+        return True
+
+    def remove(self, stroke_id, seg_idx, x0, y0, x1, y1, half_width):
+        removed = False
+        for key in self._cells(*capsule_box(x0, y0, x1, y1, half_width)):
+            cell = self.cells.get(key)
+            if cell is not None and cell.pop((stroke_id, seg_idx), None) is not None:
+                removed = True
+                if not cell:
+                    del self.cells[key]
+        return removed
+
+    def rebucket(self, cell_size):
+        """
+        칸 크기를 바꾸고 모든 선분을 새 격자에 다시 등록
+        """
+        items = {key: item for cell in self.cells.values() for key, item in cell.items()}
+        self.cell_size = max(1, int(cell_size))
+        self.cells = {}
+        for item in items.values():
+            self.insert(*item)
+
+    def iter_circle(self, cx, cy, radius):
+        seen = set()
+        for key in self._cells(cx - radius, cy - radius, cx + radius, cy + radius):
+            for item_key, (s_id, seg_idx, x0, y0, x1, y1, hw) in self.cells.get(key, {}).items():
+                if item_key in seen:
+                    continue
+                seen.add(item_key)
+                if segment_distance_sq(cx, cy, x0, y0, x1, y1) <= (radius + hw) ** 2:
+                    yield s_id, seg_idx, x0, y0, x1, y1
+
+    def query_circle(self, cx, cy, radius, out=None):
+        found = [] if out is None else out
+        found.extend(self.iter_circle(cx, cy, radius))
+        return found
+
+    def query_stroke_ids(self, cx, cy, radius, out=None):
+        found = set() if out is None else out
+        for key in self._cells(cx - radius, cy - radius, cx + radius, cy + radius):
+            for s_id, seg_idx, x0, y0, x1, y1, hw in self.cells.get(key, {}).values():
+                if s_id not in found and segment_distance_sq(cx, cy, x0, y0, x1, y1) <= (radius + hw) ** 2:
+                    found.add(s_id)
+        return found
+
+    def query_rect(self, left, top, right, bottom, out=None):
+        found, seen = ([] if out is None else out), set()
+        for key in self._cells(left, top, right, bottom):
+            for item_key, (s_id, seg_idx, x0, y0, x1, y1, hw) in self.cells.get(key, {}).items():
+                if item_key in seen:
+                    continue
+                seen.add(item_key)
+                bl, bt, br, bb = capsule_box(x0, y0, x1, y1, hw)
+                if bl <= right and br >= left and bt <= bottom and bb >= top:
+                    found.append((s_id, seg_idx, x0, y0, x1, y1))
+        return found
+
+    def draw(self, surface, color=(100, 200, 255), thickness=1, offset=(0, 0)):
+        ox, oy = offset
+        cs = self.cell_size
+        for cx, cy in self.cells:
+            pygame.draw.rect(surface, color, pygame.Rect(cx * cs + ox, cy * cs + oy, cs, cs), thickness)
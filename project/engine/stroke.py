@@ -1,36 +1,319 @@
 # engine/stroke.py
 
+import numpy as np
+from engine.simplify import simplify_points, rdp_mask, max_deviation
+
+POINT_DTYPE = np.float32
+INITIAL_CAPACITY = 16
+
 class Stroke:
-    def __init__(self, color, radius):
+    # 점 좌표는 (N, 2) float32 배열에 연속으로 저장하고, 꽉 차면 두 배로 늘린다
+    __slots__ = ("id", "color", "radius", "_buf", "_n", "_bbox")
+
+    def __init__(self, color, radius, points=None):
+        self.id = None  # VectorLayer에 추가될 때 부여되는 고유 ID
         self.color = color
         self.radius = radius
-        self.points = []
+        self._buf = np.empty((INITIAL_CAPACITY, 2), dtype=POINT_DTYPE)
+        self._n = 0
+        self._bbox = None  # 중심선 점들의 [min_x, min_y, max_x, max_y], 점이 추가될 때마다 넓힌다
+        if points is not None:
+            self.points = points
 
-    def add_point(self, x, y):
-        new_point = (x, y)
-        if not self.points:
-            self.points.append(new_point)
+    @classmethod
+    def wrap(cls, color, radius, points, bounds=None):
+        """
+        (N, 2) float32 배열을 복사하지 않고 그대로 저장 버퍼로 쓰는 stroke (문서 불러오기)
+        - bounds를 주면 bounding box를 다시 계산하지 않는다
+        - 배열이 꽉 찬 상태이므로 점을 더 추가하면 그때 새 버퍼로 복사된다
+        """
+        stroke = cls(color, radius)
+        stroke._buf = points
+        stroke._n = len(points)
+        if bounds is not None:
+            r = radius
+            x0, y0, x1, y1 = bounds
+            stroke._bbox = [x0 + r, y0 + r, x1 - r, y1 - r]
+        elif isinstance(stroke, CurveStroke):
+            stroke._grow_curve_bbox(0)
+        else:
+            stroke._grow_bbox(points)
+        return stroke
+
+    @property
+    def points(self):
+        # 복사 없는 (N, 2) view, 렌더링/공간 인덱스에서 그대로 사용한다
+        return self._buf[:self._n]
+
+    @points.setter
+    def points(self, points):
+        points = np.asarray(points, dtype=POINT_DTYPE).reshape(-1, 2)
+        self._buf = points.copy()
+        self._n = len(points)
+        self._bbox = None
+        self._grow_bbox(points)
+
+    @property
+    def stable_count(self):
+        # 이후 점이 추가되어도 바뀌지 않는 앞쪽 점의 개수
+        return self._n
+
+    @property
+    def bounds(self):
+        """
+        반지름만큼 넓힌 bounding box (left, top, right, bottom), 점이 없으면 None
+        """
+        if self._bbox is None:
+            return None
+        x0, y0, x1, y1 = self._bbox
+        r = self.radius
+        return x0 - r, y0 - r, x1 + r, y1 + r
+
+    @property
+    def nbytes(self):
+        return 64 + self._buf.nbytes
+
+    def _grow_bbox(self, points):
+        if not len(points):
             return
+        (x0, y0), (x1, y1) = points.min(axis=0).tolist(), points.max(axis=0).tolist()
+        if self._bbox is None:
+            self._bbox = [x0, y0, x1, y1]
+        else:
+            box = self._bbox
+            box[0], box[1] = min(box[0], x0), min(box[1], y0)
+            box[2], box[3] = max(box[2], x1), max(box[3], y1)
+
+    def _reserve(self, count):
+        if count <= len(self._buf):
+            return
+        capacity = max(count, len(self._buf) * 2)
+        buf = np.empty((capacity, 2), dtype=POINT_DTYPE)
+        buf[:self._n] = self._buf[:self._n]
+        self._buf = buf
 
-        last_point = self.points[-1]
-        x0, y0 = last_point
-        x1, y1 = new_point
+    def _append(self, x, y):
+        self._reserve(self._n + 1)
+        self._buf[self._n] = (x, y)
+        self._n += 1
 
-        dx = x1 - x0
-        dy = y1 - y0
-        dist = (dx ** 2 + dy ** 2) ** 0.5
+    def simplify(self, tolerance):
+        """
+        RDP로 점 수를 줄이고 (줄이기 전, 줄인 후) 점 개수를 반환
+        """
+        before = self._n
+        if before > 2:
+            self.points = simplify_points(self._buf[:self._n], tolerance)
+        return before, self._n
+
+    def release_cache(self):
+        # 점에서 다시 만들 수 있는 캐시를 버린다 (Stroke는 캐시가 없다)
+        pass
+
+    def trim(self):
+        # 그리기가 끝난 stroke는 남는 용량을 돌려준다
+        if len(self._buf) != self._n:
+            self._buf = self._buf[:self._n].copy()
+
+    def add_point(self, x, y):
+        self.add_points([(x, y)])
+
+    def add_points(self, points):
+        """
+        입력 점 여러 개를 한 번에 추가 (모아둔 MOUSEMOTION 이벤트 등)
+        - 직전 점과의 거리가 SPEED_THRESHOLD 보다 크면 브러시 반지름에 비례한 간격으로 보간
+        - 보간 점들은 NumPy로 한꺼번에 계산해서 버퍼에 바로 쓴다
+        """
+        raw = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not len(raw):
+            return
+        if not self._n:
+            self._append(*raw[0])
+            self._grow_bbox(self._buf[:1])
+            raw = raw[1:]
+            if not len(raw):
+                return
 
         # 일정 거리 이상만 보간 수행
         SPEED_THRESHOLD = 3  # 이 거리 이상이면 보간
+        # 보간 간격을 브러시 반지름에 비례하여 결정
+        spacing = max(1.0, self.radius * 0.15)
 
-        if dist > SPEED_THRESHOLD:
-            # 보간 간격을 브러시 반지름에 비례하여 결정
-            spacing = max(1.0, self.radius * 0.15)
-            steps = int(dist // spacing)
-            for i in range(1, steps + 1):
-                t = i / steps
-                interp_x = int(x0 + t * dx)
-                interp_y = int(y0 + t * dy)
-                self.points.append((interp_x, interp_y))
-        else:
-            self.points.append(new_point)
+        # 보간된 구간의 끝점은 입력 점을 정수로 자른 값이 되므로 다음 구간의 시작점도 그에 맞춘다
+        prev = np.vstack((self._buf[self._n - 1], raw[:-1]))
+        interp = np.hypot(raw[:, 0] - prev[:, 0], raw[:, 1] - prev[:, 1]) > SPEED_THRESHOLD
+        ends = np.where(interp[:, None], np.trunc(raw), raw)
+        starts = np.vstack((self._buf[self._n - 1], ends[:-1]))
+        delta = raw - starts
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        steps = np.where(interp, np.maximum(1, dist // spacing), 1).astype(np.intp)
+
+        # 구간별 t = i / steps (i = 1..steps) 를 한 번에 생성
+        total = int(steps.sum())
+        seg = np.repeat(np.arange(len(steps)), steps)
+        i = np.arange(1, total + 1) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = (i / steps[seg])[:, None]
+        out = starts[seg] + t * delta[seg]
+        out = np.where(interp[seg][:, None], np.trunc(out), out)
+
+        self._reserve(self._n + total)
+        self._buf[self._n:self._n + total] = out
+        self._grow_bbox(self._buf[self._n:self._n + total])
+        self._n += total
+
+FLATTEN_TOLERANCE = 0.25  # 화면 픽셀 단위 허용 오차
+# 곡선 단순화에서 곡선 오차가 넘칠 때 RDP 허용 오차를 절반으로 줄여 다시 시도하는 횟수
+CURVE_SIMPLIFY_ATTEMPTS = 4
+MAX_CACHED_ZOOMS = 4
+
+class CurveStroke(Stroke):
+    """
+    입력된 제어점만 저장하고, Catmull-Rom 곡선을 그릴 때 평탄화하는 stroke
+    - points: 배율 1.0에서 평탄화한 polyline (공간 인덱스, 지우개, 캐시 렌더링에 사용)
+    - 평탄화 결과는 캐시하지만, 확정되어 타일 캐시에 그려진 뒤에는 release_cache로 버리고
+      제어점만 남긴다 (다시 필요하면 그때 평탄화한다)
+    - flatten(zoom): 화면 오차가 FLATTEN_TOLERANCE 이하가 되도록 배율별로 평탄화하고 캐시한다
+    - bounds: 곡선을 감싸는 베지어 제어점까지 포함하므로 실제 곡선보다 조금 클 수 있다
+    """
+    __slots__ = ("_flat",)
+
+    # 이보다 가까운 입력 점은 제어점으로 추가하지 않는다
+    MIN_CONTROL_DISTANCE = 1.0
+
+    def __init__(self, color, radius, points=None):
+        self._flat = {}
+        super().__init__(color, radius, points)
+
+    @property
+    def control_points(self):
+        return self._buf[:self._n]
+
+    @property
+    def points(self):
+        return self.flatten(1.0)[0]
+
+    @points.setter
+    def points(self, points):
+        # 제어점을 바꾼다
+        Stroke.points.fset(self, points)
+        self._flat = {}
+        self._grow_curve_bbox(0)
+
+    @property
+    def stable_count(self):
+        # 제어점이 더 추가되어도 모양이 바뀌지 않는 앞쪽 점의 개수 (배율 1.0 기준)
+        return self.flatten(1.0)[1]
+
+    @property
+    def nbytes(self):
+        return super().nbytes + sum(flat.nbytes for flat, _ in self._flat.values())
+
+    def add_points(self, points):
+        raw = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        start = self._n
+        for x, y in raw.tolist():
+            if self._n:
+                x0, y0 = self._buf[self._n - 1].tolist()
+                if (x - x0) ** 2 + (y - y0) ** 2 < self.MIN_CONTROL_DISTANCE ** 2:
+                    continue
+            self._append(x, y)
+        self._flat = {}
+        if self._n > start:
+            self._grow_curve_bbox(start)
+
+    def release_cache(self):
+        self._flat = {}
+
+    def simplify(self, tolerance):
+        """
+        제어점을 RDP로 줄이고 (줄이기 전, 줄인 후) 제어점 개수를 반환
+        - 제어점이 빠지면 곡선이 제어점 사이에서 더 크게 움직일 수 있으므로, 평탄화한 곡선이
+          원래 곡선에서 tolerance 안에 있을 때만 받아들이고, 넘치면 더 작은 허용 오차로 다시 시도한다
+        """
+        before = self._n
+        if before <= 2:
+            return before, before
+        ctrl = self.control_points
+        original, starts = self._curve(FLATTEN_TOLERANCE)
+        rdp_tolerance = tolerance
+        for _ in range(CURVE_SIMPLIFY_ATTEMPTS):
+            keep = rdp_mask(ctrl, rdp_tolerance)
+            if keep.all():
+                break
+            if self._curve_error(original, starts, ctrl[keep], np.flatnonzero(keep)) <= tolerance:
+                self.points = ctrl[keep]
+                break
+            rdp_tolerance /= 2
+        return before, self._n
+
+    def _curve_error(self, original, starts, kept_ctrl, kept):
+        """
+        kept 번째 제어점만 남긴 곡선이 original 곡선에서 벗어난 최대 거리
+        - 두 곡선 모두 남은 제어점을 지나므로, 남은 제어점 사이 구간끼리만 비교한다
+        """
+        candidate, kept_starts = CurveStroke(self.color, self.radius, kept_ctrl)._curve(FLATTEN_TOLERANCE)
+        error = 0.0
+        # 빠진 제어점이 없는 구간도 이웃 제어점이 빠지면 접선이 바뀌므로 모든 구간을 본다
+        for i in range(len(kept) - 1):
+            a = original[starts[kept[i]]:starts[kept[i + 1]] + 1]
+            b = candidate[kept_starts[i]:kept_starts[i + 1] + 1]
+            error = max(error, max_deviation(a, b))
+        return error
+
+    def _grow_curve_bbox(self, start):
+        # 새 제어점 P_k가 바꾸는 베지어 제어점: P_(k-1) +- (P_k - P_(k-2)) / 6
+        ctrl = self._buf[max(0, start - 2):self._n].astype(np.float64)
+        self._grow_bbox(ctrl)
+        if len(ctrl) >= 3:
+            tangent = (ctrl[2:] - ctrl[:-2]) / 6
+            self._grow_bbox(np.vstack((ctrl[1:-1] + tangent, ctrl[1:-1] - tangent)))
+
+    def flatten(self, zoom=1.0):
+        """
+        (평탄화된 (N, 2) float32 배열, stable_count)를 반환
+        """
+        key = round(zoom, 3)
+        flat = self._flat  # 내보내기 스레드가 읽는 중에 release_cache가 바꿔 끼워도 안전하도록
+        cached = flat.get(key)
+        if cached is None:
+            cached = self._flatten(FLATTEN_TOLERANCE / zoom)
+            if len(flat) >= MAX_CACHED_ZOOMS:
+                flat.pop(next(iter(flat)), None)
+            flat[key] = cached
+        return cached
+
+    def _flatten(self, tolerance):
+        flat, starts = self._curve(tolerance)
+        # 마지막 구간은 다음 제어점에 따라 모양이 바뀐다
+        stable = int(starts[-2]) + 1 if len(starts) >= 2 else len(flat)
+        return flat, stable
+
+    def _curve(self, tolerance):
+        """
+        (평탄화된 (N, 2) float32 배열, 제어점별 평탄화 배열 안의 위치)
+        """
+        ctrl = self.control_points.astype(np.float64)
+        n = len(ctrl)
+        if n < 2:
+            return ctrl.astype(POINT_DTYPE), np.arange(n)
+
+        # 각 구간 (P1 -> P2)을 3차 베지어로 바꾼다: B1 = P1 + (P2 - P0) / 6, B2 = P2 - (P3 - P1) / 6
+        q = np.vstack((ctrl[:1], ctrl, ctrl[-1:]))
+        p0, p1, p2, p3 = q[:-3], q[1:-2], q[2:-1], q[3:]
+        b0, b1, b2, b3 = p1, p1 + (p2 - p0) / 6, p2 - (p3 - p1) / 6, p2
+
+        # 구간별 분할 수 (Wang의 공식): n >= sqrt(3/4 * max|B0 - 2B1 + B2|, |B1 - 2B2 + B3| / tol)
+        d = np.maximum(np.hypot(*(b0 - 2 * b1 + b2).T), np.hypot(*(b1 - 2 * b2 + b3).T))
+        steps = np.ceil(np.sqrt(0.75 * d / tolerance))
+        steps = np.maximum(steps, 1).astype(np.intp)
+
+        # t = k / steps (k = 1..steps) 를 구간별로 한꺼번에 생성해서 베지어 평가
+        seg = np.repeat(np.arange(len(steps)), steps)
+        k = np.arange(1, int(steps.sum()) + 1) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = (k / steps[seg])[:, None]
+        u = 1 - t
+        curve = (u**3 * b0[seg] + 3 * u**2 * t * b1[seg] + 3 * u * t**2 * b2[seg] + t**3 * b3[seg])
+
+        flat = np.vstack((ctrl[:1], curve)).astype(POINT_DTYPE)
+        flat.setflags(write=False)
+        return flat, np.concatenate(([0], np.cumsum(steps)))
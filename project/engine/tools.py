@@ -1,13 +1,209 @@
 # engine/tools.py
 
+import zlib
+import numpy as np
+
+TILE_SIZE = 64
+
+def _pack(array, compress):
+    data = array.tobytes()
+    return zlib.compress(data, 1) if compress else data
+
+def _unpack(data, shape, compress):
+    if compress:
+        data = zlib.decompress(data)
+    return np.frombuffer(data, dtype=np.uint8).reshape(shape)
+
+def tile_slices(ty, tx, tile_size, height, width):
+    y0, x0 = ty * tile_size, tx * tile_size
+    return slice(y0, min(y0 + tile_size, height)), slice(x0, min(x0 + tile_size, width))
+
 class DrawCommand:
-    def __init__(self, layer, prev_state, new_state):
+    """
+    래스터 편집 되돌리기 명령
+    - 레이어 전체가 아니라 바뀐 타일의 이전/이후 바이트만 (zlib 압축해서) 저장한다
+    """
+    label = "래스터 그리기"
+
+    def __init__(self, layer, prev_state=None, new_state=None, tile_size=TILE_SIZE, compress=True):
+        self.layer = layer
+        self.tile_size = tile_size
+        self.compress = compress
+        self.tiles = []  # (ty, tx, shape, before, after)
+        if prev_state is not None and new_state is not None:
+            height, width = prev_state.shape[:2]
+            for ty in range((height + tile_size - 1) // tile_size):
+                for tx in range((width + tile_size - 1) // tile_size):
+                    ys, xs = tile_slices(ty, tx, tile_size, height, width)
+                    before, after = prev_state[ys, xs], new_state[ys, xs]
+                    if not np.array_equal(before, after):
+                        self._add_tile(ty, tx, before, after)
+
+    @classmethod
+    def from_tiles(cls, layer, before_tiles, tile_size=TILE_SIZE, compress=True):
+        """
+        편집 전에 저장해둔 타일들({(ty, tx): 배열})과 현재 레이어를 비교해서 명령 생성
+        """
+        cmd = cls(layer, tile_size=tile_size, compress=compress)
+        for (ty, tx), before in before_tiles.items():
+            ys, xs = tile_slices(ty, tx, tile_size, layer.height, layer.width)
+            after = layer.read(xs.start, ys.start, xs.stop, ys.stop)
+            if not np.array_equal(before, after):
+                cmd._add_tile(ty, tx, before, after)
+        return cmd
+
+    def _add_tile(self, ty, tx, before, after):
+        self.tiles.append((ty, tx, before.shape,
+                           _pack(before, self.compress), _pack(after, self.compress)))
+
+    @property
+    def nbytes(self):
+        return sum(len(before) + len(after) for *_, before, after in self.tiles)
+
+    def _apply(self, which):
+        layer = self.layer
+        for ty, tx, shape, before, after in self.tiles:
+            ys, xs = tile_slices(ty, tx, self.tile_size, layer.height, layer.width)
+            data = after if which == "after" else before
+            layer.write(xs.start, ys.start, _unpack(data, shape, self.compress))
+        self.layer.touch()
+
+    def execute(self):
+        self._apply("after")
+
+    def undo(self):
+        self._apply("before")
+
+class TileRecorder:
+    """
+    편집 중 처음 건드리는 타일만 원본을 복사해두고, 끝나면 DrawCommand로 만든다
+    """
+    def __init__(self, layer, tile_size=TILE_SIZE):
         self.layer = layer
-        self.prev_state = prev_state.copy()
-        self.new_state = new_state.copy()
+        self.tile_size = tile_size
+        self.before = {}
+
+    def touch(self, bbox):
+        x0, y0, x1, y1 = bbox
+        if x0 >= x1 or y0 >= y1:
+            return
+        ts = self.tile_size
+        layer = self.layer
+        for ty in range(y0 // ts, (y1 - 1) // ts + 1):
+            for tx in range(x0 // ts, (x1 - 1) // ts + 1):
+                if (ty, tx) not in self.before:
+                    ys, xs = tile_slices(ty, tx, ts, layer.height, layer.width)
+                    self.before[(ty, tx)] = np.array(layer.read(xs.start, ys.start, xs.stop, ys.stop))
+
+    def touch_pixels(self, ys, xs):
+        """
+        픽셀 (ys, xs)가 들어있는 타일만 기록 (dab이 실제로 덮는 타일, bounding box의 나머지는 보지 않는다)
+        """
+        if not len(ys):
+            return
+        ts = self.tile_size
+        layer = self.layer
+        cols = (layer.width + ts - 1) // ts
+        for key in np.unique((ys // ts) * cols + xs // ts).tolist():
+            ty, tx = divmod(key, cols)
+            if (ty, tx) not in self.before:
+                rows, columns = tile_slices(ty, tx, ts, layer.height, layer.width)
+                self.before[(ty, tx)] = np.array(layer.read(columns.start, rows.start, columns.stop, rows.stop))
+
+    def finish(self):
+        cmd = DrawCommand.from_tiles(self.layer, self.before, self.tile_size)
+        self.before = {}
+        return cmd if cmd.tiles else None
+
+
+class AddStrokeCommand:
+    label = "stroke 추가"
+
+    def __init__(self, vector_layer, stroke):
+        self.vector_layer = vector_layer
+        self.stroke = stroke
+
+    @property
+    def nbytes(self):
+        return self.stroke.nbytes
 
     def execute(self):
-        self.layer.pixels[:] = self.new_state
+        self.vector_layer.add_stroke(self.stroke)
 
     def undo(self):
-        self.layer.pixels[:] = self.prev_state
+        self.vector_layer.remove_stroke(self.stroke.id)
+
+    def discard(self, undone):
+        # 되돌린 상태로 버려지면 다시 추가될 일이 없으므로 인덱스에서 제거
+        if undone:
+            self.vector_layer.forget(self.stroke.id)
+
+class RemoveStrokeCommand:
+    label = "stroke 제거"
+
+    def __init__(self, vector_layer, stroke):
+        self.vector_layer = vector_layer
+        self.stroke = stroke
+
+    @property
+    def nbytes(self):
+        return self.stroke.nbytes
+
+    def execute(self):
+        self.vector_layer.remove_stroke(self.stroke.id)
+
+    def undo(self):
+        self.vector_layer.add_stroke(self.stroke)
+
+    def discard(self, undone):
+        if not undone:
+            self.vector_layer.forget(self.stroke.id)
+
+class SplitStrokeCommand:
+    label = "분할"
+
+    def __init__(self, vector_layer, original, parts):
+        self.vector_layer = vector_layer
+        self.original = original
+        self.parts = parts
+
+    @property
+    def nbytes(self):
+        return self.original.nbytes + sum(s.nbytes for s in self.parts)
+
+    def execute(self):
+        self.vector_layer.replace_stroke(self.original.id, self.parts)
+
+    def undo(self):
+        for s in self.parts:
+            self.vector_layer.remove_stroke(s.id)
+        self.vector_layer.add_stroke(self.original)
+
+    def discard(self, undone):
+        for s in ([self.original] if not undone else self.parts):
+            self.vector_layer.forget(s.id)
+
+class CompoundCommand:
+    """
+    여러 명령을 하나의 되돌리기 단계로 묶음 (예: 지우개 드래그 한 번)
+    """
+    def __init__(self, commands, label=None):
+        self.commands = list(commands)
+        self.label = label or (self.commands[0].label if len(self.commands) == 1 else "묶음 편집")
+
+    @property
+    def nbytes(self):
+        return sum(getattr(cmd, "nbytes", 0) for cmd in self.commands)
+
+    def execute(self):
+        for cmd in self.commands:
+            cmd.execute()
+
+    def undo(self):
+        for cmd in reversed(self.commands):
+            cmd.undo()
+
+    def discard(self, undone):
+        for cmd in self.commands:
+            if hasattr(cmd, "discard"):
+                cmd.discard(undone)
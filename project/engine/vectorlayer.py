@@ -1,88 +1,434 @@
 # engine/vectorlayer.py
 
+import math
+import threading
 import pygame
+import numpy as np
 from engine.stroke import Stroke
 from engine.quadtree import QuadtreeNode
+from engine.spatial_hash import SpatialHash, CELL_SIZE
+from engine.rtree import PackedRTree
+
+TILE_SIZE = 128
+COMPACT_MIN_POINTS = 10000
+# 이보다 긴 선분은 나눠서 그린다 (draw_strokes_clipped 참고)
+DRAW_SEGMENT_LENGTH = 32
+
+def subdivide_polyline(points, max_length):
+    """
+    max_length 보다 긴 구간 사이에 점을 채워 넣은 (N, 2) 배열
+    """
+    if len(points) < 2:
+        return points
+    delta = np.diff(points, axis=0)
+    steps = np.maximum(1, np.ceil(np.hypot(delta[:, 0], delta[:, 1]) / max_length)).astype(np.intp)
+    if (steps == 1).all():
+        return points
+    seg = np.repeat(np.arange(len(steps)), steps)
+    k = np.arange(int(steps.sum())) - np.repeat(np.cumsum(steps) - steps, steps)
+    filled = points[seg] + (k / steps[seg])[:, None] * delta[seg]
+    return np.vstack((filled, points[-1:]))
+
+def draw_stroke(surface, stroke, offset=(0, 0)):
+    if not len(stroke.points):
+        return
+    points = stroke.points + offset
+    if len(points) >= 2:
+        lines = subdivide_polyline(points, DRAW_SEGMENT_LENGTH).tolist()
+        pygame.draw.lines(surface, stroke.color[:3], False, lines, max(1, stroke.radius))
+    for point in points.tolist():
+        pygame.draw.circle(surface, stroke.color[:3], point, stroke.radius // 2)
+
+# 작업 surface는 스레드마다 따로 둔다 (백그라운드 내보내기도 같은 함수로 그린다)
+_local = threading.local()
+
+def draw_strokes_clipped(surface, strokes, rect, offset=(0, 0)):
+    """
+    strokes를 surface의 rect 영역 안에만 그리기
+    - 굵은 선은 잘린 경계 근처에서 모양이 달라지므로, 가장 굵은 stroke와 선분 길이만큼
+      여유를 둔 작업 surface에 그린 뒤 rect 부분만 옮겨 그린다
+    - rect에 닿는 선분은 작업 surface 안에 통째로 들어가므로 타일마다 같은 픽셀이 나온다
+    """
+    rect = pygame.Rect(rect)
+    margin = max((stroke.radius for stroke in strokes), default=0) + DRAW_SEGMENT_LENGTH + 2
+    w, h = rect.width + 2 * margin, rect.height + 2 * margin
+    _scratch = getattr(_local, "scratch", None)
+    if _scratch is None or _scratch.get_width() < w or _scratch.get_height() < h:
+        _scratch = pygame.Surface((max(w, _scratch.get_width() if _scratch else 0),
+                                   max(h, _scratch.get_height() if _scratch else 0)), pygame.SRCALPHA)
+        _local.scratch = _scratch
+    _scratch.fill((0, 0, 0, 0), pygame.Rect(0, 0, w, h))
+    ox, oy = offset
+    for stroke in strokes:
+        draw_stroke(_scratch, stroke, offset=(ox + margin - rect.x, oy + margin - rect.y))
+    surface.blit(_scratch, rect, pygame.Rect(margin, margin, rect.width, rect.height))
+
+def stroke_bounds(stroke, start=0):
+    """
+    stroke (start 번째 점부터)를 덮는 pygame.Rect, 전체는 stroke.bounds 를 그대로 쓴다
+    """
+    if start:
+        points = stroke.points[start:]
+        (x0, y0), (x1, y1) = points.min(axis=0).tolist(), points.max(axis=0).tolist()
+        r = stroke.radius
+        x0, y0, x1, y1 = x0 - r, y0 - r, x1 + r, y1 + r
+    else:
+        x0, y0, x1, y1 = stroke.bounds
+    left, top = math.floor(x0), math.floor(y0)
+    return pygame.Rect(left, top, math.ceil(x1) - left + 1, math.ceil(y1) - top + 1)
+
+def stroke_segments(stroke):
+    """
+    stroke의 선분들을 (seg_idx, x0, y0, x1, y1, half_width)로 나열, 점이 하나뿐이면 길이 0인 선분 하나
+    - half_width는 draw_stroke가 그리는 선 두께의 절반
+    """
+    points = stroke.points.tolist()
+    if len(points) == 1:
+        points = points * 2
+    half_width = max(1, stroke.radius) / 2
+    for i, ((x0, y0), (x1, y1)) in enumerate(zip(points, points[1:])):
+        yield i, x0, y0, x1, y1, half_width
+
+# 선분을 추가/제거하는 동적 공간 인덱스 종류
+INDEX_BACKENDS = {
+    "quadtree": lambda width, height, cell_size: QuadtreeNode(0, 0, width, height),
+    "hash": lambda width, height, cell_size: SpatialHash(width, height, cell_size),
+}
+
+class StrokeSnapshot:
+    """
+    VectorLayer의 한 시점 stroke 목록 (그리기 순서), 다른 스레드에서 영역을 그릴 때 쓴다
+    - 확정된 stroke는 수정되지 않고 교체만 되므로, 목록만 복사하고 stroke 객체는 공유한다
+    """
+    def __init__(self, width, height, strokes, bounds):
+        self.width = width
+        self.height = height
+        self.strokes = strokes
+        self.bounds = bounds
+        self._boxes = None
+
+    def render_region(self, surface, rect, offset=(0, 0)):
+        # VectorLayer.render_region과 같은 결과 (strokes_in_rect의 colliderect 조건을 벡터화)
+        rect = pygame.Rect(rect)
+        if self._boxes is None:
+            # stroke별 (x, y, right, bottom), 처음 그릴 때 (그리는 스레드에서) 한 번만 만든다
+            self._boxes = np.array([(r.x, r.y, r.right, r.bottom) for r in self.bounds],
+                                   dtype=np.int64).reshape(-1, 4)
+        b = self._boxes
+        hits = np.flatnonzero((b[:, 0] < rect.right) & (b[:, 2] > rect.x) &
+                              (b[:, 1] < rect.bottom) & (b[:, 3] > rect.y) &
+                              (b[:, 2] > b[:, 0]) & (b[:, 3] > b[:, 1]))
+        ox, oy = offset
+        draw_strokes_clipped(surface, [self.strokes[i] for i in hits.tolist()], rect.move(ox, oy), offset)
 
 class VectorLayer:
-    def __init__(self):
-        self.strokes = []
-        self.quadtree = None
+    """
+    - backend: 공간 인덱스 종류 ("quadtree" 또는 "hash")
+    - cell_size: "hash" 의 칸 크기, 지우개 지름 정도가 적당하다
+    """
+    def __init__(self, width, height, tile_size=TILE_SIZE, backend="quadtree", cell_size=CELL_SIZE):
+        self.width = width
+        self.height = height
+        self.strokes = {}  # stroke_id -> Stroke (삽입 순서 = 그리기 순서)
+        self.bounds = {}   # stroke_id -> pygame.Rect
+        self.next_id = 0
+
+        # stroke 단위 인덱스: 타일 -> 그 타일에 bounding box가 걸친 살아있는 stroke ID
+        # 렌더링, 지우개, 영역 내보내기가 선분을 보기 전에 stroke 전체를 먼저 걸러낸다
+        self.order = {}  # stroke_id -> 그리기 순서
+        self.next_order = 0
+        self.tile_strokes = {}
+
+        # 지워졌지만 인덱스에는 남겨둔 stroke, 되돌리기로 복원할 때 재색인 없이 O(1)
+        self.detached = {}
+        self.detached_points = 0
+        self.indexed_points = 0
+        self.backend = backend
+        self.cell_size = cell_size
+        self.index = self._new_index()
+
+        # 확정된 stroke들을 미리 그려두는 캐시, 변경된 타일만 다시 그린다
+        self.tile_size = tile_size
+        self.cache = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.dirty_tiles = set()
 
     def add_stroke(self, stroke):
-        self.strokes.append(stroke)
-        if self.quadtree:
-            for p_idx, (x, y) in enumerate(stroke.points):
-                self.quadtree.insert(len(self.strokes) - 1, p_idx, x, y)
+        # 되돌리기로 복원되는 stroke는 기존 ID를 그대로 유지한다
+        if stroke.id is None:
+            stroke.id = self.next_id
+            self.next_id += 1
+        if self.detached.pop(stroke.id, None) is not None:
+            self.detached_points -= len(stroke.points)
+        else:
+            stroke.trim()
+            self._index_stroke(stroke)
+            if len(stroke.points):
+                self.bounds[stroke.id] = stroke_bounds(stroke)
+        self.strokes[stroke.id] = stroke
+        self.order[stroke.id] = self.next_order
+        self.next_order += 1
+        rect = self.bounds.get(stroke.id)
+        if rect:
+            for key in self._tiles(rect):
+                self.tile_strokes.setdefault(key, set()).add(stroke.id)
+            self.mark_dirty(rect)
+        return stroke.id
+
+    def load_strokes(self, strokes):
+        """
+        기존 stroke를 모두 버리고 strokes(그리기 순서, ID 부여됨)로 채운 뒤 인덱스를 한 번에 만든다
+        """
+        self.strokes, self.bounds, self.order, self.tile_strokes = {}, {}, {}, {}
+        self.detached.clear()
+        self.next_order = 0
+        for stroke in strokes:
+            self.strokes[stroke.id] = stroke
+            self.order[stroke.id] = self.next_order
+            self.next_order += 1
+            if stroke.bounds is not None:
+                rect = self.bounds[stroke.id] = stroke_bounds(stroke)
+                for key in self._tiles(rect):
+                    self.tile_strokes.setdefault(key, set()).add(stroke.id)
+        self.next_id = max(self.strokes, default=-1) + 1
+        self.rebuild_index()
+        self.mark_dirty(self.cache.get_rect())
+
+    def remove_stroke(self, stroke_id):
+        stroke = self.strokes.pop(stroke_id, None)
+        if stroke is not None:
+            self.detached[stroke_id] = stroke
+            self.detached_points += len(stroke.points)
+            stroke.release_cache()
+            del self.order[stroke_id]
+            rect = self.bounds.get(stroke_id)
+            if rect:
+                for key in self._tiles(rect):
+                    ids = self.tile_strokes[key]
+                    ids.discard(stroke_id)
+                    if not ids:
+                        del self.tile_strokes[key]
+                self.mark_dirty(rect)
+            if self.detached_points > max(COMPACT_MIN_POINTS, self.indexed_points // 2):
+                self.compact()
+        return stroke
+
+    def forget(self, stroke_id):
+        """
+        다시 복원되지 않을 stroke를 인덱스에서 완전히 제거
+        """
+        stroke = self.detached.pop(stroke_id, None)
+        if stroke is not None:
+            self.detached_points -= len(stroke.points)
+            self._unindex_stroke(stroke)
+            self.bounds.pop(stroke_id, None)
+
+    def compact(self):
+        for stroke_id in list(self.detached):
+            self.forget(stroke_id)
+
+    def replace_stroke(self, original_id, parts):
+        self.remove_stroke(original_id)
+        for s in parts:
+            self.add_stroke(s)
+
+    def _index_stroke(self, stroke):
+        self.indexed_points += len(stroke.points)
+        if self.index:
+            for segment in stroke_segments(stroke):
+                self.index.insert(stroke.id, *segment)
+
+    def _unindex_stroke(self, stroke):
+        self.indexed_points -= len(stroke.points)
+        if self.index:
+            for segment in stroke_segments(stroke):
+                self.index.remove(stroke.id, *segment)
+
+    def fit_cell_size(self, radius):
+        """
+        지우개 반지름에 맞춰 공간 해시의 칸 크기를 조정 ("hash" 백엔드만), 다시 나눴으면 True
+        - 칸이 지름보다 작아지면 (원 질의가 4칸을 넘음) 또는 지름의 3배보다 커지면 3 x 반지름으로 맞춘다
+        - 그 사이에서는 그대로 두어 휠을 돌릴 때마다 다시 나누지 않는다
+        """
+        if self.backend != "hash" or 2 * radius <= self.cell_size <= 6 * radius:
+            return False
+        self.cell_size = 3 * radius
+        for index in (self.index, getattr(self.index, "overflow", None)):
+            if isinstance(index, SpatialHash):
+                index.rebucket(self.cell_size)
+        return True
+
+    def _new_index(self):
+        return INDEX_BACKENDS[self.backend](self.width, self.height, self.cell_size)
+
+    def _tiles(self, rect):
+        rect = rect.clip(self.cache.get_rect())
+        if rect.width <= 0 or rect.height <= 0:
+            return
+        ts = self.tile_size
+        for ty in range(rect.top // ts, (rect.bottom - 1) // ts + 1):
+            for tx in range(rect.left // ts, (rect.right - 1) // ts + 1):
+                yield tx, ty
+
+    def mark_dirty(self, rect):
+        self.dirty_tiles.update(self._tiles(rect))
+
+    def strokes_in_rect(self, rect):
+        """
+        bounding box가 rect와 겹치는 살아있는 stroke들 (그리기 순서)
+        """
+        rect = pygame.Rect(rect)
+        ids = set()
+        for key in self._tiles(rect):
+            ids.update(self.tile_strokes.get(key, ()))
+        hits = [s_id for s_id in ids if self.bounds[s_id].colliderect(rect)]
+        hits.sort(key=self.order.__getitem__)
+        return [self.strokes[s_id] for s_id in hits]
+
+    def update_cache(self):
+        """
+        dirty 타일만 다시 래스터화하고, 갱신된 영역(캔버스 좌표) 목록을 반환
+        - 그린 stroke는 캐시에 남았으므로 평탄화 결과 같은 stroke 쪽 캐시는 버린다
+        """
+        refreshed = []
+        drawn = {}
+        ts = self.tile_size
+        for tx, ty in self.dirty_tiles:
+            tile = pygame.Rect(tx * ts, ty * ts, ts, ts).clip(self.cache.get_rect())
+            self.cache.fill((0, 0, 0, 0), tile)
+            strokes = self.strokes_in_rect(tile)
+            draw_strokes_clipped(self.cache, strokes, tile)
+            drawn.update((stroke.id, stroke) for stroke in strokes)
+            refreshed.append(tile)
+        self.dirty_tiles.clear()
+        for stroke in drawn.values():
+            stroke.release_cache()
+        return refreshed
 
     def render(self, surface, offset=(0, 0)):
+        self.update_cache()
+        surface.blit(self.cache, offset)
+
+    def render_region(self, surface, rect, offset=(0, 0)):
+        """
+        캐시를 거치지 않고 rect(캔버스 좌표) 영역에 걸친 stroke만 surface에 직접 그린다 (영역 내보내기)
+        """
+        rect = pygame.Rect(rect)
         ox, oy = offset
-        for stroke in self.strokes:
-            if len(stroke.points) >= 2:
-                adjusted = [(x + ox, y + oy) for x, y in stroke.points]
-                pygame.draw.lines(surface, stroke.color[:3], False, adjusted, max(1, stroke.radius))
-            for x, y in stroke.points:
-                pygame.draw.circle(surface, stroke.color[:3], (x + ox, y + oy), stroke.radius // 2)
-
-    def rebuild_quadtree(self, width, height):
-        self.quadtree = QuadtreeNode(0, 0, width, height)
-        for s_idx, stroke in enumerate(self.strokes):
-            for p_idx, (x, y) in enumerate(stroke.points):
-                self.quadtree.insert(s_idx, p_idx, x, y)
+        draw_strokes_clipped(surface, self.strokes_in_rect(rect), rect.move(ox, oy), offset)
+
+    def snapshot(self):
+        """
+        지금 stroke들의 StrokeSnapshot (백그라운드 내보내기용)
+        """
+        ids = sorted(self.strokes, key=self.order.__getitem__)
+        return StrokeSnapshot(self.width, self.height, [self.strokes[s_id] for s_id in ids],
+                              [self.bounds[s_id] for s_id in ids])
+
+    def rebuild_index(self, width=None, height=None):
+        """
+        모든 stroke로 공간 인덱스를 새로 만든다 (문서 불러오기, 전체 재구성)
+        - 선분 배열을 한 번에 모아 PackedRTree로 bulk load 하고, 이후 편집은 backend 인덱스가 받는다
+        """
+        self.width = width or self.width
+        self.height = height or self.height
+        for stroke_id in self.detached:
+            self.bounds.pop(stroke_id, None)
+        self.detached.clear()
+        self.detached_points = 0
+        self.indexed_points = sum(len(stroke.points) for stroke in self.strokes.values())
+        self.index = PackedRTree.from_strokes(self.strokes.values(), self.width, self.height,
+                                              overflow=self._new_index())
+
+    def _any_stroke_near(self, cx, cy, radius):
+        # 지우개 원의 bounding box에 걸친 stroke가 하나도 없으면 선분 인덱스를 보지 않는다
+        r = int(np.ceil(radius)) + 1
+        rect = pygame.Rect(int(cx) - r, int(cy) - r, 2 * r + 1, 2 * r + 1)
+        for key in self._tiles(rect):
+            for s_id in self.tile_strokes.get(key, ()):
+                if self.bounds[s_id].colliderect(rect):
+                    return True
+        return False
 
     def erase_near(self, x, y, radius, offset=(0, 0)):
         ox, oy = offset
         cx, cy = x - ox, y - oy
-        if not self.quadtree:
-            return None
-        near_points = self.quadtree.query_circle(cx, cy, radius)
-        stroke_indices = set(s_idx for s_idx, *_ in near_points)
+        if not self.index:
+            return []
+        if not self._any_stroke_near(cx, cy, radius):
+            return []
+        stroke_ids = self.index.query_stroke_ids(cx, cy, radius)
         erased = []
-        for s_idx in sorted(stroke_indices, reverse=True):
-            if 0 <= s_idx < len(self.strokes):
-                erased.append(self.strokes.pop(s_idx))
-        return erased[0] if erased else None
+        for s_id in stroke_ids:
+            stroke = self.remove_stroke(s_id)
+            if stroke is not None:
+                erased.append(stroke)
+        return erased
 
     def partial_erase(self, x, y, radius, offset=(0, 0)):
+        """
+        지우개 원 안에 들어간 부분을 잘라내고, 영향을 받은 모든 stroke의 (원본, 남은 조각들) 목록을 반환
+        """
         ox, oy = offset
         cx, cy = x - ox, y - oy
-        if not self.quadtree:
-            return None
-        near_points = self.quadtree.query_circle(cx, cy, radius)
-        affected = {}
-        for s_idx, p_idx, *_ in near_points:
-            affected.setdefault(s_idx, []).append(p_idx)
-        for s_idx in sorted(affected.keys(), reverse=True):
-            if 0 <= s_idx < len(self.strokes):
-                stroke = self.strokes.pop(s_idx)
-                indices = sorted(affected[s_idx])
-                parts = self.split_stroke(stroke, indices)
-                for s in parts:
-                    self.strokes.append(s)
-                    if self.quadtree:
-                        new_s_idx = len(self.strokes) - 1
-                        for p_idx, (x, y) in enumerate(s.points):
-                            self.quadtree.insert(new_s_idx, p_idx, x, y)
-                return stroke, parts
-        return None
+        if not self.index:
+            return []
+        replacements = []
+        if not self._any_stroke_near(cx, cy, radius):
+            return replacements
+        for s_id in self.index.query_stroke_ids(cx, cy, radius):
+            stroke = self.strokes.get(s_id)
+            if stroke is None:
+                continue
+            parts = self.clip_stroke(stroke, cx, cy, radius)
+            if parts is not None:
+                replacements.append((stroke, parts))
+        self.replace_strokes(replacements)
+        return replacements
+
+    def replace_strokes(self, replacements):
+        for original, parts in replacements:
+            self.replace_stroke(original.id, parts)
 
     @staticmethod
-    def split_stroke(stroke, erased_indices):
-        if not erased_indices:
-            return [stroke]
-        segments, current = [], []
-        erased_set = set(erased_indices)
-        for i, pt in enumerate(stroke.points):
-            if i in erased_set:
-                if current:
-                    s = Stroke(stroke.color, stroke.radius)
-                    s.points = current
-                    segments.append(s)
-                    current = []
-            else:
-                current.append(pt)
-        if current:
-            s = Stroke(stroke.color, stroke.radius)
-            s.points = current
-            segments.append(s)
-        return segments
+    def clip_stroke(stroke, cx, cy, radius):
+        """
+        stroke에서 원 (cx, cy)과 겹치는 부분을 원과 선분의 교점에서 잘라낸 조각 목록
+        - 선 두께까지 지워지도록 반지름에 선 두께의 절반을 더한다
+        - 원과 만나지 않으면 None
+        """
+        points = stroke.points.astype(np.float64)
+        r = radius + max(1, stroke.radius) / 2
+        center = np.array((cx, cy))
+        if len(points) < 2:
+            if len(points) and ((points[0] - center) ** 2).sum() <= r * r:
+                return []
+            return None
+
+        # |A + tD - C|^2 = r^2 를 풀어 각 선분이 원 안에 있는 구간 [t0, t1] 을 구한다
+        a_pts = points[:-1]
+        d = points[1:] - a_pts
+        f = a_pts - center
+        a = (d * d).sum(axis=1)
+        b = 2 * (d * f).sum(axis=1)
+        c = (f * f).sum(axis=1) - r * r
+        disc = b * b - 4 * a * c
+        root = np.sqrt(np.maximum(disc, 0))
+        safe = np.where(a > 0, 2 * a, 1)
+        t0 = np.where(a > 0, (-b - root) / safe, np.where(c <= 0, 0.0, 1.0))
+        t1 = np.where(a > 0, (-b + root) / safe, np.where(c <= 0, 1.0, 0.0))
+        t0, t1 = np.clip(t0, 0, 1), np.clip(t1, 0, 1)
+        cut = (t0 < t1) & ((disc > 0) | (a == 0))
+        if not cut.any():
+            return None
+
+        # 잘리지 않은 선분 구간은 그대로 복사하고, 잘린 선분에서만 교점을 이어 붙인다
+        pieces = []
+        head, run_start = [], 0
+        for i in np.flatnonzero(cut).tolist():
+            body = points[run_start:i + 1] if t0[i] > 0 else points[run_start:i]
+            tail = [a_pts[i] + t0[i] * d[i]] if t0[i] > 0 else []
+            pieces.append(np.vstack(head + [body] + tail) if head or tail else body)
+            head = [a_pts[i] + t1[i] * d[i]] if t1[i] < 1 else []
+            run_start = i + 1
+        pieces.append(np.vstack(head + [points[run_start:]]) if head else points[run_start:])
+        return [Stroke(stroke.color, stroke.radius, piece) for piece in pieces if len(piece) >= 2]
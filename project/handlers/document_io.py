@@ -0,0 +1,40 @@
+# handlers/document_io.py
+
+import os
+import pygame
+from engine.document import save_document, load_document
+from engine.history import History
+from utils.constants import DOCUMENT_PATH, HISTORY_MAX_BYTES
+
+def handle_document_io(event, keys, canvas, vector_layer, history):
+    """
+    Ctrl+S: 문서 저장, Ctrl+O: 문서 불러오기
+    불러오면 새 Canvas, VectorLayer와 빈 History를 반환한다
+    """
+    if event.type == pygame.KEYDOWN and pygame.key.get_mods() & pygame.KMOD_CTRL:
+        if event.key == pygame.K_s:
+            try:
+                save_document(DOCUMENT_PATH, canvas, vector_layer)
+            except OSError as e:
+                # 저장하지 못해도 편집 중인 문서는 그대로 둔다
+                print(f"❌ 문서를 저장하지 못했습니다: {e}")
+            else:
+                print(f"💾 문서 저장: {DOCUMENT_PATH} (stroke {len(vector_layer.strokes)}개)")
+
+        elif event.key == pygame.K_o:
+            if not os.path.exists(DOCUMENT_PATH):
+                print(f"❌ 문서가 없습니다: {DOCUMENT_PATH}")
+            else:
+                try:
+                    loaded = load_document(DOCUMENT_PATH, backend=vector_layer.backend,
+                                           cell_size=vector_layer.cell_size, storage=canvas.storage)
+                except (ValueError, OSError) as e:
+                    # 읽지 못한 문서는 버리고 지금 문서를 그대로 둔다
+                    print(f"❌ 문서를 불러오지 못했습니다: {e}")
+                else:
+                    # 불러온 stroke는 이전 History의 명령들과 관계가 없으므로 History도 새로 만든다
+                    canvas, vector_layer = loaded
+                    history = History(max_bytes=HISTORY_MAX_BYTES)
+                    print(f"📂 문서 불러오기: {DOCUMENT_PATH} (stroke {len(vector_layer.strokes)}개)")
+
+    return canvas, vector_layer, history
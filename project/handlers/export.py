@@ -0,0 +1,23 @@
+# handlers/export.py
+
+import pygame
+from utils.helpers import export_filename
+
+def handle_export(event, keys, exporter, canvas, vector_layer):
+    """
+    Ctrl+E: 캔버스를 PNG로 내보내기 (백그라운드 스레드에서 저장, 진행 중이면 무시)
+    """
+    if event.type == pygame.KEYDOWN and event.key == pygame.K_e and pygame.key.get_mods() & pygame.KMOD_CTRL:
+        path = export_filename()
+        # Canvas는 창 전체 크기이므로 그리기 영역 (vector layer) 크기만 내보낸다
+        if exporter.start(path, canvas, vector_layer, size=(vector_layer.width, vector_layer.height)):
+            print(f"💾 내보내기 시작: {path}")
+        else:
+            print(f"❌ 이미 내보내는 중입니다: {exporter.path}")
+
+def report_export(path, error):
+    # BackgroundExporter 완료 콜백 (메인 스레드에서 호출됨)
+    if error:
+        print(f"❌ 내보내기 실패: {path} ({error})")
+    else:
+        print(f"💾 저장 완료: {path}")
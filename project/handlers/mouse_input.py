@@ -1,35 +1,59 @@
 # handlers/mouse_input.py
 
 import pygame
-from engine.stroke import Stroke
-from utils.constants import MIN_RADIUS, MAX_RADIUS
+from engine.stroke import Stroke, CurveStroke
+from engine.tools import AddStrokeCommand, RemoveStrokeCommand, SplitStrokeCommand
+from utils.constants import MIN_RADIUS, MAX_RADIUS, SMOOTH_STROKES, SIMPLIFY_TOLERANCE
+
+def erase_at(x, y, eraser_mode, vector_layer, history, eraser_radius, TOOLBAR_LEFT, TOOLBAR_TOP):
+    if eraser_mode == "stroke":
+        cx, cy = x - TOOLBAR_LEFT, y - TOOLBAR_TOP
+        for stroke in vector_layer.erase_near(cx, cy, eraser_radius):
+            history.push(RemoveStrokeCommand(vector_layer, stroke))
+    elif eraser_mode == "area":
+        for original, parts in vector_layer.partial_erase(x, y, eraser_radius, offset=(TOOLBAR_LEFT, TOOLBAR_TOP)):
+            history.push(SplitStrokeCommand(vector_layer, original, parts))
+
+def simplify_stroke(stroke):
+    """
+    확정 직전의 stroke 점을 줄이기, 허용 오차는 반지름에 비례하고 최소 0.5px
+    """
+    if SIMPLIFY_TOLERANCE is None:
+        return
+    before, after = stroke.simplify(max(0.5, stroke.radius * SIMPLIFY_TOLERANCE))
+    if after < before:
+        print(f"✂️ [SIMPLIFY] 점 {before}개 → {after}개 ({before - after}개 제거)")
+
+def add_motion_points(stroke, events, TOOLBAR_LEFT, TOOLBAR_TOP, CANVAS_WIDTH, CANVAS_HEIGHT):
+    """
+    쌓여 있던 MOUSEMOTION 이벤트들의 좌표를 한 번에 stroke에 추가
+    """
+    points = [
+        (x - TOOLBAR_LEFT, y - TOOLBAR_TOP)
+        for x, y in (event.pos for event in events if event.buttons[0])
+        if TOOLBAR_LEFT <= x < TOOLBAR_LEFT + CANVAS_WIDTH and TOOLBAR_TOP <= y < TOOLBAR_TOP + CANVAS_HEIGHT
+    ]
+    if points:
+        stroke.add_points(points)
 
 def handle_mouse_input(event, current_tool, eraser_mode, canvas, vector_layer,
-                       undo_stack, redo_stack, TOOLBAR_LEFT, TOOLBAR_TOP,
+                       history, TOOLBAR_LEFT, TOOLBAR_TOP,
                        CANVAS_WIDTH, CANVAS_HEIGHT, brush_color, brush_radius,
                        eraser_radius, current_stroke):
     x, y = pygame.mouse.get_pos()
 
     if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+        if current_tool == "eraser":
+            # 드래그 한 번 동안의 지우기는 하나의 되돌리기 단계로 묶는다
+            history.begin_group()
         if TOOLBAR_LEFT <= x < TOOLBAR_LEFT + CANVAS_WIDTH and TOOLBAR_TOP <= y < TOOLBAR_TOP + CANVAS_HEIGHT:
             cx, cy = x - TOOLBAR_LEFT, y - TOOLBAR_TOP
             if current_tool == "brush":
-                current_stroke = Stroke(brush_color, brush_radius)
+                stroke_type = CurveStroke if SMOOTH_STROKES else Stroke
+                current_stroke = stroke_type(brush_color, brush_radius)
                 current_stroke.add_point(cx, cy)
             elif current_tool == "eraser":
-                if eraser_mode == "stroke":
-                    removed = vector_layer.erase_near(cx, cy, eraser_radius)
-                    vector_layer.rebuild_quadtree(CANVAS_WIDTH, CANVAS_HEIGHT)
-                    if removed:
-                        undo_stack.append(("remove_stroke", removed))
-                        redo_stack.clear()
-                elif eraser_mode == "area":
-                    result = vector_layer.partial_erase(x, y, eraser_radius, offset=(TOOLBAR_LEFT, TOOLBAR_TOP))
-                    vector_layer.rebuild_quadtree(CANVAS_WIDTH, CANVAS_HEIGHT)
-                    if result:
-                        original, parts = result
-                        undo_stack.append(("split_stroke", original, parts))
-                        redo_stack.clear()
+                erase_at(x, y, eraser_mode, vector_layer, history, eraser_radius, TOOLBAR_LEFT, TOOLBAR_TOP)
 
     elif event.type == pygame.MOUSEMOTION:
         if pygame.mouse.get_pressed()[0]:
@@ -40,28 +64,14 @@ def handle_mouse_input(event, current_tool, eraser_mode, canvas, vector_layer,
                     current_stroke.add_point(cx, cy)
 
                 elif current_tool == "eraser":
-                    if eraser_mode == "stroke":
-                        removed = vector_layer.erase_near(cx, cy, eraser_radius)
-                        vector_layer.rebuild_quadtree(CANVAS_WIDTH, CANVAS_HEIGHT)
-                        if removed:
-                            undo_stack.append(("remove_stroke", removed))
-                            redo_stack.clear()
-
-                    elif eraser_mode == "area":
-                        result = vector_layer.partial_erase(x, y, eraser_radius, offset=(TOOLBAR_LEFT, TOOLBAR_TOP))
-                        vector_layer.rebuild_quadtree(CANVAS_WIDTH, CANVAS_HEIGHT)
-                        if result:
-                            original, parts = result
-                            undo_stack.append(("split_stroke", original, parts))
-                            redo_stack.clear()
+                    erase_at(x, y, eraser_mode, vector_layer, history, eraser_radius, TOOLBAR_LEFT, TOOLBAR_TOP)
 
     elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
         if current_tool == "brush" and current_stroke:
-            vector_layer.add_stroke(current_stroke)
-            vector_layer.rebuild_quadtree(CANVAS_WIDTH, CANVAS_HEIGHT)
-            undo_stack.append(("add_stroke", current_stroke))
-            redo_stack.clear()
+            simplify_stroke(current_stroke)
+            history.execute(AddStrokeCommand(vector_layer, current_stroke))
             current_stroke = None
+        history.end_group("지우개")
 
     if event.type == pygame.MOUSEWHEEL:
         if current_tool == "brush":
@@ -71,4 +81,4 @@ def handle_mouse_input(event, current_tool, eraser_mode, canvas, vector_layer,
             eraser_radius += event.y
             eraser_radius = max(MIN_RADIUS, min(MAX_RADIUS, eraser_radius))
 
-    return current_stroke, undo_stack, redo_stack, brush_radius, eraser_radius
+    return current_stroke, brush_radius, eraser_radius
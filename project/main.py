@@ -1,17 +1,22 @@
 # main.py
 
 import pygame
-import numpy as np
 import datetime
 
 from engine.canvas import Canvas
 from engine.stroke import Stroke
-from engine.vectorlayer import VectorLayer
+from engine.history import History
+from engine.vectorlayer import VectorLayer, draw_strokes_clipped, stroke_bounds
 from utils.constants import *
-from utils.helpers import draw_notebook_background, save_canvas_as_png
+from utils.helpers import render_canvas_background
+from utils.dirty_region import DirtyRegion
+from utils.export import BackgroundExporter
+from utils.ui import draw_toolbar, draw_cursor_overlay, cursor_overlay_rect, draw_export_status, export_status_rect
 from handlers.color_tool import handle_color_change, handle_tool_switch
 from handlers.undo_redo import handle_undo_redo
-from handlers.mouse_input import handle_mouse_input
+from handlers.document_io import handle_document_io
+from handlers.export import handle_export, report_export
+from handlers.mouse_input import handle_mouse_input, add_motion_points
 
 def main(is_debug):
     # 초기화
@@ -22,10 +27,9 @@ def main(is_debug):
     font = pygame.font.SysFont("Arial", 20)
 
     cursor_img = pygame.image.load("./resources/cursor.png").convert_alpha()
-    cursor_rect = cursor_img.get_rect()
     pygame.mouse.set_visible(False)
 
-    canvas = Canvas(SCREEN_WIDTH, SCREEN_HEIGHT)
+    canvas = Canvas(SCREEN_WIDTH, SCREEN_HEIGHT, storage=LAYER_STORAGE)
     canvas.add_layer("Base Layer")
     canvas.select_layer(0)
 
@@ -33,60 +37,132 @@ def main(is_debug):
     brush_radius = 10
     eraser_radius = 10
 
-    undo_stack, redo_stack = [], []
+    history = History(max_bytes=HISTORY_MAX_BYTES)
     current_stroke = None
     current_tool = "brush"
     eraser_mode = "stroke"
-    vector_layer = VectorLayer()
+    # 공간 해시 칸 크기는 지우개 지름보다 조금 크게 (원 질의가 2x2 칸 안에서 끝나도록), 지우개 크기가 바뀌면 fit_cell_size가 다시 맞춘다
+    vector_layer = VectorLayer(CANVAS_WIDTH, CANVAS_HEIGHT, backend=SPATIAL_INDEX, cell_size=3 * eraser_radius)
+
+    exporter = BackgroundExporter(on_done=report_export)
+
+    canvas_rect = pygame.Rect(TOOLBAR_LEFT, TOOLBAR_TOP, CANVAS_WIDTH, CANVAS_HEIGHT)
+    canvas_offset = (TOOLBAR_LEFT, TOOLBAR_TOP)
+    background = None
+    canvas_revision = None
+
+    dirty = DirtyRegion(screen.get_rect())
+    dirty.add_all()
+    ui_state = None
+    cursor_rect = None
+    live_stroke, live_rect, live_tail = None, None, None
+    live_count, live_stable = 0, 0
 
     running = True
     while running:
         keys = pygame.key.get_pressed()
-        mouse_x, mouse_y = pygame.mouse.get_pos()
 
-        for event in pygame.event.get():
+        # 바뀐 것이 없으면 다음 이벤트가 올 때까지 대기 (idle 모드)
+        events = pygame.event.get()
+        if not events and not dirty:
+            events = [pygame.event.wait()] + pygame.event.get()
+
+        motion_events = []
+        for event in events:
+            # 브러시로 그리는 중의 이동 이벤트는 모아서 한 번에 stroke에 추가
+            if event.type == pygame.MOUSEMOTION and current_tool == "brush" and current_stroke:
+                motion_events.append(event)
+                continue
+            if motion_events:
+                add_motion_points(current_stroke, motion_events, TOOLBAR_LEFT, TOOLBAR_TOP, CANVAS_WIDTH, CANVAS_HEIGHT)
+                motion_events = []
+
             if event.type == pygame.QUIT:
                 running = False
+            if exporter.handle_event(event):
+                dirty.add(export_status_rect())
 
             brush_color, current_tool, eraser_mode = handle_color_change(event, keys, brush_color, current_tool, eraser_mode)
             current_tool, eraser_mode = handle_tool_switch(event, keys, current_tool, eraser_mode)
-            undo_stack, redo_stack = handle_undo_redo(event, keys, undo_stack, redo_stack, vector_layer)
-            current_stroke, undo_stack, redo_stack, brush_radius, eraser_radius = handle_mouse_input(
+            handle_undo_redo(event, keys, history)
+            handle_export(event, keys, exporter, canvas, vector_layer)
+            loaded = handle_document_io(event, keys, canvas, vector_layer, history)
+            if loaded[0] is not canvas:
+                canvas, vector_layer, history = loaded
+                current_stroke = None
+                dirty.add_all()
+            current_stroke, brush_radius, eraser_radius = handle_mouse_input(
                 event, current_tool, eraser_mode, canvas, vector_layer,
-                undo_stack, redo_stack, TOOLBAR_LEFT, TOOLBAR_TOP,
+                history, TOOLBAR_LEFT, TOOLBAR_TOP,
                 CANVAS_WIDTH, CANVAS_HEIGHT, brush_color, brush_radius,
                 eraser_radius, current_stroke
             )
-
-        # 화면 초기화 및 렌더링
+        if motion_events:
+            add_motion_points(current_stroke, motion_events, TOOLBAR_LEFT, TOOLBAR_TOP, CANVAS_WIDTH, CANVAS_HEIGHT)
+        vector_layer.fit_cell_size(eraser_radius)
+
+        # 변경 영역 수집
+        new_ui_state = (brush_color, brush_radius, eraser_radius, current_tool)
+        if new_ui_state != ui_state:
+            ui_state = new_ui_state
+            dirty.add_all()
+
+        # 래스터 레이어가 바뀐 경우에만 배경을 다시 합성
+        if canvas.revision() != canvas_revision:
+            canvas_revision = canvas.revision()
+            background = render_canvas_background(canvas, CANVAS_WIDTH, CANVAS_HEIGHT)
+            dirty.add(canvas_rect)
+
+        for rect in vector_layer.update_cache():
+            dirty.add(rect, canvas_offset)
+
+        if current_stroke is not live_stroke:
+            dirty.add(live_rect, canvas_offset)
+            live_stroke, live_rect, live_tail = current_stroke, None, None
+            live_count, live_stable = 0, 0
+        if live_stroke and len(live_stroke.points) != live_count:
+            # 확정된 앞부분은 그대로 두고, 바뀔 수 있는 꼬리 부분(이전 꼬리 포함)만 다시 그린다
+            rect = stroke_bounds(live_stroke, start=max(0, live_stable - 1))
+            dirty.add(live_tail, canvas_offset)
+            dirty.add(rect, canvas_offset)
+            live_rect = rect if live_rect is None else live_rect.union(rect)
+            live_tail = rect
+            live_count, live_stable = len(live_stroke.points), live_stroke.stable_count
+
+        new_cursor_rect = cursor_overlay_rect(cursor_img, current_tool, brush_radius, eraser_radius)
+        if new_cursor_rect != cursor_rect:
+            dirty.add(cursor_rect)
+            dirty.add(new_cursor_rect)
+            cursor_rect = new_cursor_rect
+
+        rects = dirty.flush()
+        if not rects:
+            clock.tick(180)
+            continue
+
+        # 변경된 영역만 다시 그림
+        clip = rects[0].unionall(rects[1:])
+        screen.set_clip(clip)
         screen.fill((255, 255, 255))
+        screen.blit(background, canvas_rect)
 
-        frame = canvas.render().astype(np.uint8)
-        frame = frame[:CANVAS_HEIGHT, :CANVAS_WIDTH]
-        image_surface = pygame.surfarray.make_surface(np.transpose(frame[:, :, :3], (1, 0, 2)))
-        screen.blit(image_surface, (TOOLBAR_LEFT, TOOLBAR_TOP))
-
-        draw_notebook_background(screen.subsurface(
-            pygame.Rect(TOOLBAR_LEFT, TOOLBAR_TOP, CANVAS_WIDTH, CANVAS_HEIGHT)))
-
-        vector_layer.render(screen, offset=(TOOLBAR_LEFT, TOOLBAR_TOP))
+        vector_layer.render(screen, offset=canvas_offset)
 
         if current_stroke and current_tool == "brush":
-            if len(current_stroke.points) >= 2:
-                adjusted_points = [(x + TOOLBAR_LEFT, y + TOOLBAR_TOP) for x, y in current_stroke.points]
-                pygame.draw.lines(screen, current_stroke.color[:3], False, adjusted_points, max(1, current_stroke.radius))
-            for x, y in current_stroke.points:
-                pygame.draw.circle(screen, current_stroke.color[:3], (x + TOOLBAR_LEFT, y + TOOLBAR_TOP), current_stroke.radius // 2)
+            draw_strokes_clipped(screen, [current_stroke], clip.clip(canvas_rect), offset=canvas_offset)
 
-        from utils.ui import draw_toolbar, draw_cursor_overlay
         draw_toolbar(screen, brush_color, brush_radius, eraser_radius, font, current_tool)
+        draw_export_status(screen, font, exporter.status, exporter.progress)
         draw_cursor_overlay(screen, cursor_img, current_tool, brush_radius, eraser_radius)
 
         if is_debug:
-            if vector_layer.quadtree:
-                vector_layer.quadtree.draw(screen, color=(0, 128, 255), thickness=1, offset=(TOOLBAR_LEFT, TOOLBAR_TOP))
+            if vector_layer.index:
+                vector_layer.index.draw(screen, color=(0, 128, 255), thickness=1, offset=canvas_offset)
 
-        pygame.display.flip()
+        screen.set_clip(None)
+        pygame.display.update(rects)
         clock.tick(180)
 
+    # 진행 중인 내보내기는 끝까지 쓰고 종료한다
+    exporter.wait()
     pygame.quit()
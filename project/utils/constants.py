@@ -9,6 +9,24 @@ TOOLBAR_BOTTOM = 20
 
 MIN_RADIUS, MAX_RADIUS = 1, 100
 
+HISTORY_MAX_BYTES = 64 * 1024 * 1024
+
+# True 이면 브러시 stroke를 제어점 + Catmull-Rom 곡선으로 저장
+SMOOTH_STROKES = True
+
+# stroke를 확정할 때 RDP로 점을 줄이는 허용 오차 (브러시 반지름에 대한 비율), None 이면 끔
+# CurveStroke는 제어점을 줄이고, 평탄화한 곡선이 이 오차 안에 있는지 확인한다
+SIMPLIFY_TOLERANCE = 0.1
+
+# VectorLayer 공간 인덱스 종류 ("quadtree" 또는 "hash")
+SPATIAL_INDEX = "hash"
+
+# 래스터 레이어 저장 방식 ("dense", "tiled", "memmap"), 아주 큰 캔버스는 "memmap"
+LAYER_STORAGE = "tiled"
+
+# Ctrl+S / Ctrl+O 로 저장하고 불러오는 문서 파일
+DOCUMENT_PATH = "drawing.pcnv"
+
 CANVAS_WIDTH  = 512
 CANVAS_HEIGHT = 512
 
@@ -0,0 +1,34 @@
+# utils/dirty_region.py
+
+import pygame
+
+class DirtyRegion:
+    """
+    한 프레임 동안 바뀐 화면 영역을 모아두는 추적기
+    - 아무것도 바뀌지 않았다면 flush() 결과가 비어 있어 화면 갱신을 건너뛸 수 있다
+    """
+    def __init__(self, bounds, max_rects=32):
+        self.bounds = pygame.Rect(bounds)
+        self.max_rects = max_rects
+        self.rects = []
+
+    def __bool__(self):
+        return bool(self.rects)
+
+    def add(self, rect, offset=(0, 0)):
+        if rect is None:
+            return
+        rect = pygame.Rect(rect).move(offset).clip(self.bounds)
+        if rect.width > 0 and rect.height > 0:
+            self.rects.append(rect)
+
+    def add_all(self):
+        self.rects = [self.bounds.copy()]
+
+    def flush(self):
+        rects = self.rects
+        self.rects = []
+        # 너무 잘게 쪼개진 경우 하나로 합쳐서 갱신 호출 수를 줄인다
+        if len(rects) > self.max_rects:
+            rects = [rects[0].unionall(rects[1:])]
+        return rects
@@ -0,0 +1,98 @@
+# utils/export.py
+# 캔버스 PNG 내보내기를 백그라운드 스레드에서 실행 (편집 화면은 그동안 계속 반응한다)
+
+import threading
+import pygame
+
+from utils.helpers import export_png
+
+# 작업 스레드가 메인 루프를 깨우기 위해 보내는 이벤트 (event.wait 중이어도 화면이 갱신된다)
+EXPORT_PROGRESS = pygame.event.custom_type()
+EXPORT_DONE = pygame.event.custom_type()
+
+def _post(event_type, **attrs):
+    try:
+        pygame.event.post(pygame.event.Event(event_type, **attrs))
+    except pygame.error:
+        pass  # 창이 이미 닫힌 경우
+
+class BackgroundExporter:
+    """
+    캔버스/stroke의 스냅샷을 떠서 작업 스레드에서 export_png로 저장
+    - 스냅샷은 메인 스레드에서 만든다: 래스터 타일은 copy-on-write로 공유, stroke는 목록만 복사
+    - 진행률과 완료는 pygame 이벤트로 알리고, on_done(path, error)은 handle_event 안에서
+      (즉 메인 스레드에서) 호출된다
+    - 끝나면 메인 스레드에서 캔버스 스냅샷을 release해서, 원본 레이어가 공유하던 타일을 돌려받는다
+    - status: "idle", "running", "done", "error"
+    """
+    def __init__(self, on_done=None):
+        self.on_done = on_done
+        self.status = "idle"
+        self.progress = 0.0
+        self.path = None
+        self.error = None
+        self._thread = None
+        self._snapshot = None
+
+    @property
+    def busy(self):
+        return self.status == "running"
+
+    def start(self, path, canvas, vector_layer, size=None):
+        """
+        내보내기 시작, 이미 진행 중이면 False
+        """
+        if self.busy:
+            return False
+        canvas, strokes = canvas.snapshot(), vector_layer.snapshot()
+        self.status, self.progress, self.path, self.error = "running", 0.0, path, None
+        self._snapshot = canvas
+        self._thread = threading.Thread(target=self._run, args=(path, canvas, strokes, size),
+                                        name="png-export", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, path, canvas, strokes, size):
+        shown = [-1]
+
+        def report(done, total):
+            self.progress = done / total
+            percent = done * 100 // total
+            if percent != shown[0]:
+                shown[0] = percent
+                _post(EXPORT_PROGRESS, path=path, progress=self.progress)
+
+        error = None
+        try:
+            export_png(path, canvas, strokes, size, progress=report)
+        except Exception as e:
+            error = e
+        _post(EXPORT_DONE, path=path, error=error)
+
+    def handle_event(self, event):
+        """
+        작업 스레드가 보낸 이벤트 처리, 표시할 상태가 바뀌었으면 True
+        """
+        if event.type == EXPORT_PROGRESS:
+            return self.busy
+        if event.type != EXPORT_DONE or not self.busy:
+            return False
+        self._thread.join()
+        self._thread = None
+        self._release_snapshot()
+        self.error = event.error
+        self.status = "error" if event.error else "done"
+        if self.on_done:
+            self.on_done(event.path, event.error)
+        return True
+
+    def wait(self):
+        # 종료 직전 등 메인 루프 밖에서 끝날 때까지 기다리기
+        if self._thread is not None:
+            self._thread.join()
+            self._release_snapshot()
+
+    def _release_snapshot(self):
+        if self._snapshot is not None:
+            self._snapshot.release()
+            self._snapshot = None
@@ -4,27 +4,97 @@ import pygame
 import datetime
 import numpy as np
 
+from utils.png import PNGWriter
+
+# 내보낼 때 한 번에 렌더링/압축하는 행 수, 메모리 사용량은 (너비 x 이 값)에 비례한다
+EXPORT_BAND_ROWS = 256
+
+def export_filename():
+    now = datetime.datetime.now()
+    return f"saved_{now.strftime('%Y%m%d_%H%M%S')}.png"
+
 def save_canvas_as_png(screen, canvas, vector_layer, offset=(0, 0), size=None):
-    ox, oy = offset
+    # 끝날 때까지 기다리는 동기 저장, 편집 중에는 utils.export.BackgroundExporter를 쓴다
+    filename = export_filename()
+    shown = [-1]
+
+    def report(done, total):
+        percent = done * 100 // total
+        if percent // 10 != shown[0]:
+            shown[0] = percent // 10
+            print(f"💾 저장 중... {percent}%")
+
+    export_png(filename, canvas, vector_layer, size, progress=report)
+    print(f"💾 저장 완료: {filename}")
+    return filename
+
+def export_png(path, canvas, vector_layer, size=None, band_rows=EXPORT_BAND_ROWS, progress=None):
+    """
+    공책 배경 + 래스터 레이어 + vector stroke를 PNG로 내보내기
+    - 전체 이미지를 만들지 않고 band_rows 행씩 렌더링해서 바로 압축해 쓰므로, 아주 큰 캔버스도
+      (너비 x band_rows)만큼의 메모리로 저장할 수 있다
+    - progress(완료한 행 수, 전체 행 수)가 주어지면 띠 하나를 쓸 때마다 호출한다
+    """
     width, height = size if size else (canvas.width, canvas.height)
-    save_surface = pygame.Surface((width, height))
+    with open(path, "wb") as f:
+        writer = PNGWriter(f, width, height)
+        for top in range(0, height, band_rows):
+            rows = min(band_rows, height - top)
+            band = render_export_band(canvas, vector_layer, top, width, rows)
+            rgb = np.frombuffer(pygame.image.tostring(band, "RGB"), dtype=np.uint8)
+            writer.write_rows(rgb.reshape(rows, width, 3))
+            if progress:
+                progress(top + rows, height)
+        writer.close()
 
-    frame = canvas.render().astype(np.uint8)
-    frame = frame[:height, :width]
-    canvas_surface = pygame.surfarray.make_surface(np.transpose(frame[:, :, :3], (1, 0, 2)))
-    save_surface.blit(canvas_surface, (0, 0))
+def render_export_band(canvas, vector_layer, top, width, height):
+    """
+    내보낼 이미지의 (0, top)부터 width x height 띠를 렌더링한 Surface
+    """
+    surface = pygame.Surface((width, height))
+    draw_notebook_background(surface, top=top)
 
-    draw_notebook_background(save_surface)
-    vector_layer.render(save_surface, offset=(0, 0))
+    w, h = min(width, canvas.width), min(top + height, canvas.height) - top
+    if w > 0 and h > 0:
+        blend_frame(surface, canvas.render_region(0, top, w, top + h))
 
-    now = datetime.datetime.now()
-    filename = f"saved_{now.strftime('%Y%m%d_%H%M%S')}.png"
-    pygame.image.save(save_surface, filename)
-    print(f"💾 저장 완료: {filename}")
+    # stroke는 vector layer 크기 안쪽만 (화면의 stroke 캐시와 같은 범위)
+    rect = pygame.Rect(0, top, width, height).clip(pygame.Rect(0, 0, vector_layer.width, vector_layer.height))
+    if rect.height:
+        vector_layer.render_region(surface, rect, offset=(0, -top))
+    return surface
+
+def render_canvas_background(canvas, width, height):
+    # 공책 배경 위에 래스터 레이어 합성 결과를 얹은 정적 배경 (stroke 제외), 내보내기와 같은 순서
+    surface = pygame.Surface((width, height))
+    draw_notebook_background(surface)
+    blend_frame(surface, canvas.render()[:height, :width])
+    return surface
+
+def blend_frame(surface, frame):
+    """
+    래스터 합성 결과 frame(premultiplied RGBA)을 surface 왼쪽 위부터 over 합성 (in-place)
+    - out = c + bg * (255 - a) / 255
+    """
+    if not frame[:, :, 3].any():
+        return
+    h, w = frame.shape[:2]
+    pixels = pygame.surfarray.pixels3d(surface)
+    bg = pixels[:w, :h].transpose(1, 0, 2)
+    acc = bg * (255 - frame[:, :, 3:].astype(np.uint16))
+    acc += 128
+    acc += acc >> 8
+    acc >>= 8
+    acc += frame[:, :, :3]
+    np.minimum(acc, 255, out=acc)
+    bg[...] = acc
+    del pixels, bg
 
-def draw_notebook_background(surface, line_spacing=40, line_color=(144, 238, 144), bg_color=(255, 255, 255)):
+def draw_notebook_background(surface, line_spacing=40, line_color=(144, 238, 144), bg_color=(255, 255, 255), top=0):
+    # top: surface 맨 윗줄의 이미지 y 좌표 (띠 단위로 그릴 때 줄 위치를 맞추기 위함)
     width, height = surface.get_size()
     surface.fill(bg_color)
-    for y in range(line_spacing, height, line_spacing):
+    first = max(line_spacing, -(-top // line_spacing) * line_spacing)
+    for y in range(first - top, height, line_spacing):
         for x in range(0, width, 10):
             pygame.draw.line(surface, line_color, (x, y), (x + 5, y), 1)
@@ -0,0 +1,65 @@
+# utils/png.py
+# 행 단위로 이어서 쓰는 PNG 인코더 (8비트 RGB, 표준 라이브러리 zlib만 사용)
+# 이미지 전체를 메모리에 올리지 않고 띠(band)마다 scanline을 압축해 바로 파일에 쓴다
+
+import struct
+import zlib
+import numpy as np
+
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+IDAT_SIZE = 1 << 18  # 압축된 데이터가 이만큼 모이면 IDAT chunk 하나로 내보낸다
+
+def write_chunk(f, kind, data=b""):
+    f.write(struct.pack(">I", len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+class PNGWriter:
+    """
+    width x height RGB PNG를 위에서부터 행 단위로 기록
+    - write_rows에 (h, width, 3) uint8 배열을 차례로 넘기고 close()로 마무리
+    - scanline 필터는 Sub(1): 가로로 이웃한 픽셀과의 차이를 압축해서 공책 배경/선 그림이 잘 줄어든다
+    """
+    def __init__(self, f, width, height, level=6):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self._zlib = zlib.compressobj(level)
+        self._pending = []
+        self._pending_size = 0
+        f.write(SIGNATURE)
+        write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def write_rows(self, rgb):
+        rgb = np.asarray(rgb, dtype=np.uint8)
+        h = rgb.shape[0]
+        if rgb.shape[1:] != (self.width, 3) or self.rows + h > self.height:
+            raise ValueError(f"잘못된 행 데이터: {rgb.shape}, 남은 행 {self.height - self.rows}개")
+        lines = np.empty((h, 1 + self.width * 3), dtype=np.uint8)
+        lines[:, 0] = 1
+        flat = rgb.reshape(h, -1)
+        lines[:, 1:4] = flat[:, :3]
+        np.subtract(flat[:, 3:], flat[:, :-3], out=lines[:, 4:])  # uint8 빼기는 mod 256
+        self._emit(self._zlib.compress(lines.data))
+        self.rows += h
+
+    def _emit(self, data):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending_size >= IDAT_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            write_chunk(self.f, b"IDAT", b"".join(self._pending))
+            self._pending, self._pending_size = [], 0
+
+    def close(self):
+        if self.rows != self.height:
+            raise ValueError(f"행 {self.height}개 중 {self.rows}개만 기록되었습니다")
+        self._emit(self._zlib.flush())
+        self._flush()
+        write_chunk(self.f, b"IEND")
@@ -3,12 +3,18 @@
 import pygame
 from utils.constants import *
 
+def toolbar_rects():
+    return [
+        pygame.Rect(0, 0, SCREEN_WIDTH, TOOLBAR_TOP),
+        pygame.Rect(0, SCREEN_HEIGHT - TOOLBAR_BOTTOM, SCREEN_WIDTH, TOOLBAR_BOTTOM),
+        pygame.Rect(0, 0, TOOLBAR_LEFT, SCREEN_HEIGHT),
+        pygame.Rect(SCREEN_WIDTH - TOOLBAR_RIGHT, 0, TOOLBAR_RIGHT, SCREEN_HEIGHT),
+    ]
+
 def draw_toolbar(screen, brush_color, brush_radius, eraser_radius, font, current_tool):
     TOOLBAR_BG_COLOR = (157, 200, 200)
-    screen.fill(TOOLBAR_BG_COLOR, pygame.Rect(0, 0, SCREEN_WIDTH, TOOLBAR_TOP))
-    screen.fill(TOOLBAR_BG_COLOR, pygame.Rect(0, SCREEN_HEIGHT - TOOLBAR_BOTTOM, SCREEN_WIDTH, TOOLBAR_BOTTOM))
-    screen.fill(TOOLBAR_BG_COLOR, pygame.Rect(0, 0, TOOLBAR_LEFT, SCREEN_HEIGHT))
-    screen.fill(TOOLBAR_BG_COLOR, pygame.Rect(SCREEN_WIDTH - TOOLBAR_RIGHT, 0, TOOLBAR_RIGHT, SCREEN_HEIGHT))
+    for rect in toolbar_rects():
+        screen.fill(TOOLBAR_BG_COLOR, rect)
 
     coordinate = (TOOLBAR_LEFT + CANVAS_WIDTH + TOOLBAR_RIGHT // 2, TOOLBAR_TOP + TOOLBAR_RIGHT // 2)
     margin = TOOLBAR_RIGHT // (3/2)
@@ -27,3 +33,36 @@ def draw_cursor_overlay(screen, cursor_img, current_tool, brush_radius, eraser_r
 
     radius = int(brush_radius // 1.5) if current_tool == "brush" else eraser_radius
     pygame.draw.circle(screen, (0, 0, 0), mouse_pos, radius, 1)
+
+def cursor_overlay_rect(cursor_img, current_tool, brush_radius, eraser_radius):
+    mouse_pos = pygame.mouse.get_pos()
+    radius = int(brush_radius // 1.5) if current_tool == "brush" else eraser_radius
+    circle_rect = pygame.Rect(0, 0, radius * 2 + 2, radius * 2 + 2)
+    circle_rect.center = mouse_pos
+    return cursor_img.get_rect(center=mouse_pos).union(circle_rect)
+
+def export_status_rect():
+    # 하단 툴바 오른쪽, 내보내기 진행 상태 표시 영역
+    width = 140
+    return pygame.Rect(SCREEN_WIDTH - TOOLBAR_RIGHT - width, SCREEN_HEIGHT - TOOLBAR_BOTTOM, width, TOOLBAR_BOTTOM)
+
+def draw_export_status(screen, font, status, progress):
+    """
+    백그라운드 내보내기 상태 (utils.export.BackgroundExporter.status / progress)
+    - running: 진행 막대와 퍼센트, done / error: 마지막 결과
+    """
+    if status == "idle":
+        return
+    rect = export_status_rect()
+    if status == "running":
+        bar = rect.inflate(0, -6)
+        pygame.draw.rect(screen, (255, 255, 255), bar)
+        pygame.draw.rect(screen, (48, 169, 222), (bar.x, bar.y, int(bar.width * progress), bar.height))
+        pygame.draw.rect(screen, (0, 0, 0), bar, 1)
+        text, color = f"PNG {int(progress * 100)}%", (0, 0, 0)
+    elif status == "done":
+        text, color = "PNG saved", (0, 0, 0)
+    else:
+        text, color = "Export failed", (229, 58, 64)
+    text_surface = font.render(text, True, color)
+    screen.blit(text_surface, text_surface.get_rect(center=rect.center))